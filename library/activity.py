@@ -0,0 +1,95 @@
+"""
+Buffered last-login tracking.
+
+A login used to save the whole admin/student row just to move
+``last_login``, competing with circulation writes on the same rows during
+a login storm. ``record_login`` now keeps the timestamp in a per-worker
+buffer. ``flush`` writes the whole buffer with one
+``UPDATE ... SET last_login = CASE id WHEN ... END`` per model (and per
+``FLUSH_CHUNK`` rows).
+
+The buffer is flushed after a response once it is ``ACTIVITY_FLUSH_INTERVAL``
+seconds old or holds ``ACTIVITY_FLUSH_SIZE`` entries (see
+``library.signals``), and when the process exits. A worker that crashes
+loses at most one interval of timestamps. An interval of 0 writes every
+login immediately.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FLUSH_CHUNK = 500  # rows per UPDATE
+
+_lock = threading.Lock()
+_pending = {'admin': {}, 'student': {}}
+_last_flush = time.monotonic()
+
+
+def _model(kind):
+    from .models import Admin, Student
+    return {'admin': Admin, 'student': Student}[kind]
+
+
+def record_login(kind, pk, when=None):
+    """Remember that the admin/student ``pk`` logged in at ``when``"""
+    with _lock:
+        _pending[kind][pk] = when or timezone.now()
+    maybe_flush()
+
+
+def pending_count():
+    with _lock:
+        return sum(len(stamps) for stamps in _pending.values())
+
+
+def maybe_flush():
+    """Flush the buffer if it is old or big enough"""
+    interval = getattr(settings, 'ACTIVITY_FLUSH_INTERVAL', 30)
+    size = getattr(settings, 'ACTIVITY_FLUSH_SIZE', 500)
+    count = pending_count()
+    if count and (count >= size or time.monotonic() - _last_flush >= interval):
+        flush()
+
+
+def flush():
+    """Write every buffered timestamp; returns the number of rows updated"""
+    global _pending, _last_flush
+    with _lock:
+        pending, _pending = _pending, {'admin': {}, 'student': {}}
+        _last_flush = time.monotonic()
+
+    updated = 0
+    for kind, stamps in pending.items():
+        items = list(stamps.items())
+        for start in range(0, len(items), FLUSH_CHUNK):
+            chunk = items[start:start + FLUSH_CHUNK]
+            try:
+                updated += _model(kind).objects.filter(pk__in=[pk for pk, _ in chunk]).update(
+                    last_login=Case(
+                        *[When(pk=pk, then=Value(when)) for pk, when in chunk],
+                        output_field=DateTimeField(),
+                    )
+                )
+            except Exception:
+                logger.exception('Could not write %d buffered %s login time(s)', len(chunk), kind)
+                _requeue(kind, chunk)
+    return updated
+
+
+def _requeue(kind, chunk):
+    # Keep whichever timestamp is newer if the user logged in again meanwhile
+    with _lock:
+        stamps = _pending[kind]
+        for pk, when in chunk:
+            if pk not in stamps or stamps[pk] < when:
+                stamps[pk] = when
+
+
+atexit.register(flush)
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.contrib.auth.hashers import make_password
 from .models import Admin, Author, Book, Student, IssueRequest, Fine
 
 @admin.register(Admin)
@@ -30,7 +31,7 @@ class StudentAdmin(admin.ModelAdmin):
         if not change:  # New object
             # Password should be hashed
             if 'password' in form.changed_data:
-                obj.set_password(form.cleaned_data['password'])
+                obj.password = make_password(form.cleaned_data['password'])
         super().save_model(request, obj, form, change)
 
 @admin.register(IssueRequest)
@@ -0,0 +1,78 @@
+"""
+Admission of new issue requests.
+
+A student may request a book only if they have no unpaid fines, hold fewer
+than ``MAX_BOOKS_PER_STUDENT`` books (issued, overdue or pending) and have
+no open request or loan for the same book. The student's ``StudentLedger``
+row is locked with ``SELECT ... FOR UPDATE`` first, which serializes
+concurrent requests from the same student (double clicks, several tabs),
+so the checks and the insert cannot interleave and no duplicate request
+is created.
+
+All three rules are read by that one locking statement: the fine and quota
+rules from the ledger row itself, the duplicate rule from an ``EXISTS``
+subquery in the same ``SELECT``. An admitted request costs that statement
+plus the insert. It is not a single conditional insert because MySQL has
+no partial unique constraints to reject the duplicate, and an
+``INSERT ... SELECT ... WHERE NOT EXISTS`` could neither tell the student
+which rule failed nor avoid gap-lock deadlocks between concurrent inserts.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .ledger import rebuild
+from .models import IssueRequest, StudentLedger
+
+# Outcomes of admit_request
+ADMITTED = 'admitted'
+DUPLICATE = 'duplicate'
+FINES_DUE = 'fines_due'
+QUOTA_REACHED = 'quota_reached'
+
+OPEN_STATUSES = ('requested', 'issued', 'overdue')
+
+
+def max_books_per_student():
+    return getattr(settings, 'MAX_BOOKS_PER_STUDENT', 3)
+
+
+def _ledger_rows(student_id, book_id):
+    rows = StudentLedger.objects.select_for_update().filter(pk=student_id)
+    if book_id is not None:
+        # Only the ledger row is locked: FOR UPDATE does not reach into subqueries
+        rows = rows.annotate(has_open_request=Exists(
+            IssueRequest.objects.filter(book_id=book_id, student_id=OuterRef('pk'), status__in=OPEN_STATUSES)
+        ))
+    return rows
+
+
+def lock_ledger(student_id, book_id=None):
+    """
+    Lock and return the ledger row of a student, creating it if needed.
+    With ``book_id`` the row also has ``has_open_request``, whether the
+    student has an open request or loan of that book, read in the same query.
+    """
+    ledger = _ledger_rows(student_id, book_id).first()
+    if ledger is None:
+        rebuild([student_id])
+        ledger = _ledger_rows(student_id, book_id).get()
+    return ledger
+
+
+def admit_request(student, book):
+    """
+    Create a pending issue request for ``book`` if ``student`` may borrow it.
+    Returns (outcome, issue_request); issue_request is None unless ADMITTED.
+    """
+    with transaction.atomic():
+        ledger = lock_ledger(student.pk, book.pk)
+        if ledger.has_open_request:
+            return DUPLICATE, None
+        if ledger.outstanding_fines > 0:
+            return FINES_DUE, None
+        held = ledger.active_loans + ledger.overdue_count + ledger.pending_requests
+        if held >= max_books_per_student():
+            return QUOTA_REACHED, None
+        issue_request = IssueRequest.objects.create(book=book, student=student, status='requested')
+    return ADMITTED, issue_request
@@ -0,0 +1,144 @@
+"""
+Availability checks for student usernames, student IDs and emails.
+
+``taken_identifiers`` answers the signup form with one query over the
+unique ``username_folded``/``student_id``/``email`` indexes instead of one
+``exists()`` per field. The AJAX validators, called on every keystroke,
+use an in-memory snapshot of the taken usernames (case folded) and
+student IDs kept by each worker:
+
+* a new student is added to the snapshot by the ``Student`` signal
+  handlers in ``library.signals``; other workers see the shared insert
+  version move and fetch only the students created since their last load;
+* a rename or delete bumps the shared reset version and every worker
+  reloads its snapshot, as it also does after ``SEARCH_INDEX_MAX_AGE``
+  seconds.
+
+The snapshot only backs the validators. Signup still runs the database
+check, and the unique constraints have the last word.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+INSERT_VERSION_KEY = 'library:student_identifiers:inserted'
+RESET_VERSION_KEY = 'library:student_identifiers:reset'
+
+
+def fold(username):
+    """Case-folded form of a username, as stored in ``Student.username_folded``"""
+    return (username or '').strip().lower()
+
+
+def _bump(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+        return cache.incr(key)
+
+
+def taken_identifiers(username=None, student_id=None, email=None):
+    """Names of the given fields already used by a student, with a single query"""
+    from .models import Student
+
+    lookups = {
+        'username': Q(username_folded=fold(username)) if username else None,
+        'student_id': Q(student_id=student_id) if student_id else None,
+        'email': Q(email=email) if email else None,
+    }
+    condition = Q()
+    for lookup in lookups.values():
+        if lookup is not None:
+            condition |= lookup
+    if not condition:
+        return set()
+
+    taken = set()
+    rows = Student.objects.filter(condition).order_by().values_list('username_folded', 'student_id', 'email')
+    for row_username, row_student_id, row_email in rows:
+        if username and row_username == fold(username):
+            taken.add('username')
+        if student_id and row_student_id == student_id:
+            taken.add('student_id')
+        if email and row_email == email:
+            taken.add('email')
+    return taken
+
+
+class IdentifierSnapshot:
+    """Per-worker sets of the taken usernames and student IDs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usernames = set()
+        self._student_ids = set()
+        self._last_pk = 0
+        self._versions = None
+        self._loaded_at = 0
+
+    def _current_versions(self):
+        versions = cache.get_many([INSERT_VERSION_KEY, RESET_VERSION_KEY])
+        return versions.get(INSERT_VERSION_KEY, 0), versions.get(RESET_VERSION_KEY, 0)
+
+    def _load(self, students, reset):
+        if reset:
+            self._usernames = set()
+            self._student_ids = set()
+            self._last_pk = 0
+        rows = students.values_list('pk', 'username_folded', 'student_id')
+        for pk, username_folded, student_id in rows.iterator(chunk_size=5000):
+            self._usernames.add(username_folded)
+            self._student_ids.add(student_id)
+            self._last_pk = max(self._last_pk, pk)
+
+    def ensure_fresh(self):
+        """Catch up with students created, renamed or deleted by other workers"""
+        from .models import Student
+
+        versions = self._current_versions()
+        max_age = getattr(settings, 'SEARCH_INDEX_MAX_AGE', 300)
+        with self._lock:
+            if (
+                self._versions is None
+                or versions[1] != self._versions[1]
+                or time.monotonic() - self._loaded_at > max_age
+            ):
+                self._load(Student.objects.all(), reset=True)
+                self._loaded_at = time.monotonic()
+            elif versions[0] != self._versions[0]:
+                self._load(Student.objects.filter(pk__gt=self._last_pk), reset=False)
+            self._versions = versions
+
+    def add(self, username, student_id):
+        """Record a student created in this worker"""
+        with self._lock:
+            if self._versions is None:
+                return
+            self._usernames.add(fold(username))
+            self._student_ids.add(student_id)
+
+    def username_taken(self, username):
+        self.ensure_fresh()
+        return fold(username) in self._usernames
+
+    def student_id_taken(self, student_id):
+        self.ensure_fresh()
+        return student_id in self._student_ids
+
+
+snapshot = IdentifierSnapshot()
+
+
+def student_created(username, student_id):
+    """Signal hook: a new student was committed"""
+    snapshot.add(username, student_id)
+    _bump(INSERT_VERSION_KEY)
+
+
+def identifiers_changed():
+    """Signal hook: a username or student ID was changed or freed"""
+    _bump(RESET_VERSION_KEY)
@@ -0,0 +1,338 @@
+"""
+Query-count benchmark for the library URLs.
+
+Seeds a synthetic dataset into a throwaway test database, requests every
+GET route in ``library.urls`` as an admin, a student and an anonymous
+visitor, and records the number of queries, wall time and peak Python
+memory of each request. A result fails when it exceeds its budget, which
+turns N+1 regressions into a failing ``manage.py benchmark_queries`` run.
+
+Every route and role is measured twice: ``cold``, the first request of a
+fresh worker (empty cache, in-process search indexes not built yet), and
+``warm``, once those caches are filled. Each has its own budget. The
+scheduled overdue sweep runs once before the measurements; it is a
+periodic job, not part of any page's cost.
+"""
+import logging
+import random
+import re
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern
+from django.utils import timezone
+
+from . import overdue, stats, urls
+from .availability import snapshot
+from .cache import bump_catalog_version
+from .identity import set_principal
+from .models import Admin, Author, Book, Fine, IssueRequest, Student
+from .search import catalog_index
+from .student_index import student_index
+
+BATCH_SIZE = 2000
+
+DEFAULT_SIZES = {
+    'authors': 2000,
+    'books': 10000,
+    'students': 50000,
+    'issues': 500000,
+}
+
+ROLES = ('anonymous', 'student', 'admin')
+PHASES = ('cold', 'warm')
+
+# Budget applied to every route unless overridden below
+DEFAULT_BUDGET = {'queries': 12, 'time_ms': 1500, 'memory_kb': 16384}
+
+# Per-route overrides, keyed by URL name
+ROUTE_BUDGETS = {
+    'home': {'queries': 8},
+    'admin_dashboard': {'queries': 4},
+    'admin_issues': {'queries': 6},
+    'admin_authors': {'queries': 6},
+    'admin_books': {'queries': 6},
+    'admin_students': {'queries': 6},
+    'admin_fines': {'queries': 6},
+    'student_books': {'queries': 6},
+}
+
+# Cold requests also fill the cache and build the in-process indexes
+DEFAULT_COLD_BUDGET = {'queries': 16, 'time_ms': 3000, 'memory_kb': 65536}
+COLD_ROUTE_BUDGETS = {}
+
+# Routes that change state on GET (or end the session) are not benchmarked
+SKIPPED_ROUTES = {
+    'logout',
+    'request_book',
+    'accept_issue_request',
+    'reject_issue_request',
+    'return_book_admin',
+}
+
+# Object used to fill a URL argument, by argument name or URL name
+ARGUMENT_KINDS = ('author', 'book', 'student', 'fine', 'issue', 'hold')
+ROUTE_KINDS = {
+    'admin_change_password': 'student',
+    'accept_issue_request': 'issue',
+    'reject_issue_request': 'issue',
+    'return_book_admin': 'issue',
+}
+
+CATEGORIES = ['Fiction', 'Science', 'History', 'Technology', 'Philosophy', 'Art', 'Poetry', 'Biography']
+WORDS = [
+    'river', 'shadow', 'garden', 'empire', 'silent', 'winter', 'atlas', 'machine',
+    'ocean', 'forest', 'memory', 'stone', 'light', 'code', 'storm', 'mirror',
+]
+
+
+def _chunks(objects):
+    for start in range(0, len(objects), BATCH_SIZE):
+        yield objects[start:start + BATCH_SIZE]
+
+
+def seed(authors, books, students, issues, seed_value=0):
+    """
+    Fill the current database with a synthetic catalog and circulation history.
+    Returns the fixtures used to log in and to fill URL arguments.
+    """
+    rng = random.Random(seed_value)
+    today = timezone.now().date()
+    password = make_password('benchmark')
+
+    admin = Admin.objects.create(
+        username='benchmark_admin',
+        password=password,
+        full_name='Benchmark Admin',
+        email='benchmark_admin@example.com',
+    )
+
+    Author.objects.bulk_create(
+        [Author(name=f'{rng.choice(WORDS).title()} Author {n}', bio='Synthetic author') for n in range(authors)],
+        batch_size=BATCH_SIZE,
+    )
+    author_ids = list(Author.objects.values_list('id', flat=True))
+
+    Book.objects.bulk_create(
+        [
+            Book(
+                title=f'The {rng.choice(WORDS).title()} of {rng.choice(WORDS).title()} {n}',
+                author_id=rng.choice(author_ids),
+                isbn=f'{9780000000000 + n}',
+                category=rng.choice(CATEGORIES),
+                total_copies=3,
+                available_copies=rng.randint(0, 3),
+            )
+            for n in range(books)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    book_ids = list(Book.objects.values_list('id', flat=True))
+
+    for chunk in _chunks(range(students)):
+        Student.objects.bulk_create([
+            Student(
+                student_id=f'B{n:07d}',
+                username=f'student{n}',
+                username_folded=f'student{n}',
+                password=password,
+                first_name=rng.choice(WORDS).title(),
+                last_name=f'Student{n}',
+                email=f'student{n}@example.com',
+                phone=f'01{n:09d}',
+                department=rng.choice(CATEGORIES),
+            )
+            for n in chunk
+        ])
+    student_ids = list(Student.objects.values_list('id', flat=True))
+
+    statuses = ['requested', 'issued', 'overdue', 'returned', 'returned', 'returned', 'rejected']
+    now = timezone.now()
+    for chunk in _chunks(range(issues)):
+        rows = []
+        for n in chunk:
+            status = rng.choice(statuses)
+            issue_date = today - timedelta(days=rng.randint(0, 60))
+            rows.append(IssueRequest(
+                book_id=rng.choice(book_ids),
+                # Give the benchmark student a few loans of every kind
+                student_id=student_ids[0] if n < len(statuses) else rng.choice(student_ids),
+                status=status,
+                request_date=now - timedelta(days=rng.randint(0, 90)),
+                issue_date=issue_date if status != 'requested' else None,
+                expected_return_date=issue_date + timedelta(days=14) if status != 'requested' else None,
+                actual_return_date=issue_date + timedelta(days=10) if status == 'returned' else None,
+            ))
+        IssueRequest.objects.bulk_create(rows)
+
+    overdue = IssueRequest.objects.filter(status='overdue').values_list('id', 'student_id')
+    for chunk in _chunks(list(overdue[:issues // 20])):
+        Fine.objects.bulk_create([
+            Fine(
+                issue_request_id=issue_id,
+                student_id=student_id,
+                amount=Decimal('25.00'),
+                days_overdue=5,
+                is_paid=rng.random() < 0.5,
+                invoice_number=f'INV-BENCH-{issue_id}',
+            )
+            for issue_id, student_id in chunk
+        ])
+
+    # Bulk inserts skip the model signals
+    bump_catalog_version()
+    stats.invalidate()
+
+    student = Student.objects.get(pk=student_ids[0])
+    return {
+        'admin': admin,
+        'student': student,
+        'author': Author.objects.order_by('id').first(),
+        'book': Book.objects.order_by('id').first(),
+        'issue': IssueRequest.objects.filter(student=student).order_by('id').first(),
+        'fine': Fine.objects.filter(student=student).order_by('id').first() or Fine.objects.order_by('id').first(),
+        'hold': None,
+    }
+
+
+def iter_routes():
+    """(name, route) for every benchmarked pattern in library.urls"""
+    for pattern in urls.urlpatterns:
+        if isinstance(pattern, URLPattern) and pattern.name not in SKIPPED_ROUTES:
+            yield pattern.name, str(pattern.pattern)
+
+
+def _argument_kind(name, argument):
+    for kind in ARGUMENT_KINDS:
+        if kind in argument:
+            return kind
+    if name in ROUTE_KINDS:
+        return ROUTE_KINDS[name]
+    for kind in ARGUMENT_KINDS:
+        if kind in name:
+            return kind
+    raise ValueError(f'No fixture for argument {argument!r} of route {name!r}')
+
+
+def build_path(name, route, fixtures):
+    """Fill the converters of ``route`` with the ids of the seeded fixtures"""
+    def fill(match):
+        fixture = fixtures[_argument_kind(name, match.group(2))]
+        return str(fixture.pk if fixture is not None else 0)
+    return '/' + re.sub(r'<(?:(\w+):)?(\w+)>', fill, route)
+
+
+def make_client(role, fixtures):
+    """A test client logged in through the library session keys"""
+    client = Client()
+    if role == 'anonymous':
+        return client
+    session = client.session
+    set_principal(session, role, fixtures[role].id)
+    session.save()
+    # Signed cookie sessions get a new key on every save
+    client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+    return client
+
+
+def budget_for(name, phase='warm'):
+    if phase == 'cold':
+        return {**DEFAULT_COLD_BUDGET, **COLD_ROUTE_BUDGETS.get(name, {})}
+    return {**DEFAULT_BUDGET, **ROUTE_BUDGETS.get(name, {})}
+
+
+def reset_worker_caches():
+    """Forget everything a worker caches: the shared cache and the in-process indexes"""
+    sweep_lock = cache.get(overdue.SWEEP_LOCK_KEY)
+    cache.clear()
+    if sweep_lock is not None:
+        # Keep the scheduled sweep from running again inside a measured request
+        cache.set(overdue.SWEEP_LOCK_KEY, sweep_lock, timeout=getattr(settings, 'OVERDUE_SWEEP_INTERVAL', 0) or None)
+    for index in (catalog_index, student_index, snapshot):
+        index.__init__()
+
+
+def measure(client, path, cold=False):
+    """
+    Request ``path`` and return (status, queries, time_ms, memory_kb).
+    Memory is traced on a second request so tracing does not skew the timing.
+    With ``cold`` the caches are reset before each of the two requests.
+    """
+    if cold:
+        reset_worker_caches()
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = client.get(path)
+        elapsed = (time.perf_counter() - started) * 1000
+    query_count = len(queries)
+
+    if cold:
+        reset_worker_caches()
+    tracemalloc.start()
+    try:
+        client.get(path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return response.status_code, query_count, elapsed, peak / 1024
+
+
+def run(fixtures, repeat=1, only=None):
+    """
+    Benchmark every route for every role, cold and warm. Each phase is
+    measured ``repeat`` times (warm after one request to fill the caches);
+    the worst measurement is kept.
+    """
+    clients = {role: make_client(role, fixtures) for role in ROLES}
+    overdue.run_scheduled_sweep()
+    results = []
+    # 4xx responses for the wrong role are expected; keep them out of the report
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    try:
+        _run_routes(clients, fixtures, repeat, only, results)
+    finally:
+        request_logger.setLevel(level)
+    return results
+
+
+def _run_routes(clients, fixtures, repeat, only, results):
+    for name, route in iter_routes():
+        if only and name not in only:
+            continue
+        path = build_path(name, route, fixtures)
+        for role in ROLES:
+            client = clients[role]
+            for phase in PHASES:
+                cold = phase == 'cold'
+                if not cold:
+                    client.get(path)
+                runs = [measure(client, path, cold=cold) for _ in range(max(repeat, 1))]
+                status = runs[-1][0]
+                budget = budget_for(name, phase)
+                result = {
+                    'route': name,
+                    'path': path,
+                    'role': role,
+                    'phase': phase,
+                    'status': status,
+                    'queries': max(r[1] for r in runs),
+                    'time_ms': max(r[2] for r in runs),
+                    'memory_kb': max(r[3] for r in runs),
+                }
+                result['failures'] = [
+                    metric for metric in ('queries', 'time_ms', 'memory_kb')
+                    if result[metric] > budget[metric]
+                ]
+                if status >= 500:
+                    result['failures'].append('status')
+                results.append(result)
@@ -0,0 +1,62 @@
+"""
+Two-tier cache for catalog-derived data.
+
+Values are kept in a small per-process dictionary (tier 1) in front of the
+configured Django cache (tier 2, local memory by default or a shared
+Redis/Memcached backend through ``CACHE_BACKEND``). Every entry is tagged
+with the catalog version; bumping the version on a catalog change makes
+all workers ignore their old entries without having to delete them.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'library:catalog_version'
+
+_local = {}
+_local_lock = threading.Lock()
+
+
+def get_catalog_version():
+    """Current catalog version shared through the cache"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Mark the catalog as changed for every worker"""
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        return cache.incr(CATALOG_VERSION_KEY)
+
+
+def get_versioned(key, build, timeout=None):
+    """
+    Return the cached value of ``key`` for the current catalog version,
+    calling ``build()`` to compute it on a miss in both tiers.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'CATALOG_CACHE_TTL', 300)
+    version = get_catalog_version()
+    now = time.monotonic()
+
+    entry = _local.get(key)
+    if entry is not None and entry[0] == version and entry[1] > now:
+        return entry[2]
+
+    shared_key = f'library:catalog:{key}:v{version}'
+    value = cache.get(shared_key)
+    if value is None:
+        value = build()
+        cache.set(shared_key, value, timeout=timeout)
+
+    with _local_lock:
+        _local[key] = (version, now + timeout, value)
+    return value
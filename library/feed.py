@@ -0,0 +1,78 @@
+"""
+Student notification feed.
+
+The unread count of each student is cached (``library:notifications:unread:<id>``)
+so pages can show it without a ``COUNT(*)`` on ``library_notification``. A
+per-student change version is bumped whenever a notification is added or
+read. It drops the cached count and wakes up clients waiting on the
+notification stream (``library.streaming``), so clients wait for changes
+instead of polling.
+
+Both keys only work across processes (web workers and the
+``process_notifications`` worker) with a shared cache backend. The cached
+count therefore also expires after ``NOTIFICATION_UNREAD_TTL`` seconds, so
+a per-process cache can only be that far behind.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification
+
+UNREAD_KEY = 'library:notifications:unread:{}'
+VERSION_KEY = 'library:notifications:version:{}'
+
+
+def unread_count(student_id):
+    """Number of unread notifications, from the cache when possible"""
+    key = UNREAD_KEY.format(student_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(student_id=student_id, is_read=False).count()
+        cache.set(key, count, timeout=getattr(settings, 'NOTIFICATION_UNREAD_TTL', 30))
+    return count
+
+
+def get_version(student_id):
+    """Change version of a student's feed; it moves on every insert or read"""
+    key = VERSION_KEY.format(student_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def notify_changed(student_ids):
+    """Drop the cached counts of ``student_ids`` and bump their feed versions"""
+    student_ids = {student_id for student_id in student_ids if student_id}
+    if not student_ids:
+        return
+    cache.delete_many([UNREAD_KEY.format(student_id) for student_id in student_ids])
+    for student_id in student_ids:
+        key = VERSION_KEY.format(student_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 2, timeout=None)
+
+
+def notify_changed_on_commit(student_ids):
+    student_ids = set(student_ids)
+    transaction.on_commit(lambda: notify_changed(student_ids))
+
+
+def notifications_for(student):
+    return Notification.objects.filter(student=student)
+
+
+def mark_read(student, notification_ids=None):
+    """Mark the given (or all) unread notifications of a student as read; returns the count"""
+    unread = Notification.objects.filter(student=student, is_read=False)
+    if notification_ids is not None:
+        unread = unread.filter(id__in=notification_ids)
+    updated = unread.update(is_read=True, read_at=timezone.now())
+    if updated:
+        notify_changed_on_commit([student.pk])
+    return updated
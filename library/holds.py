@@ -0,0 +1,150 @@
+"""
+Hold queue for books with no copies left.
+
+Instead of refreshing ``book_detail`` until a copy shows up, a student
+places a hold and gets a position in a first-in, first-out queue per book.
+When a returned copy goes back on the shelf, ``promote_holds`` turns the
+oldest waiting holds into pending issue requests (through the normal
+admission rules) and notifies the students.
+
+The copy a promoted request is waiting for is taken off the shelf in the
+same transaction, so nobody else can request or be issued it first. The
+circulation desk recognizes these requests (``reserved_request_ids``): they
+are issued without taking another copy, and rejecting one puts the copy
+back and offers it to the next hold.
+"""
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .admission import ADMITTED, DUPLICATE, admit_request, lock_ledger
+from .models import Book, BookHold
+from .notifications import enqueue_many
+
+# Outcomes of place_hold
+PLACED = 'placed'
+ALREADY_HOLDING = 'already_holding'
+ALREADY_OPEN = 'already_open'
+AVAILABLE = 'available'
+
+
+def _ahead_subquery():
+    """Number of waiting holds queued before the outer hold on the same book"""
+    return Subquery(
+        BookHold.objects.filter(book=OuterRef('book'), status='waiting')
+        .filter(
+            Q(created_at__lt=OuterRef('created_at'))
+            | Q(created_at=OuterRef('created_at'), id__lt=OuterRef('id'))
+        )
+        .order_by()
+        .values('book')
+        .annotate(total=Count('id'))
+        .values('total'),
+        output_field=IntegerField(),
+    )
+
+
+def with_positions(holds):
+    """Annotate waiting holds with their 1-based ``position`` in the queue"""
+    return holds.annotate(ahead=Coalesce(_ahead_subquery(), Value(0)))
+
+
+def waiting_holds(student):
+    """A student's waiting holds with their queue positions"""
+    holds = BookHold.objects.filter(student=student, status='waiting').select_related('book')
+    holds = list(with_positions(holds).order_by('created_at', 'id'))
+    for hold in holds:
+        hold.position = hold.ahead + 1
+    return holds
+
+
+def get_waiting_hold(student, book):
+    """The student's waiting hold on ``book`` with its position, or None"""
+    hold = with_positions(BookHold.objects.filter(student=student, book=book, status='waiting')).first()
+    if hold is not None:
+        hold.position = hold.ahead + 1
+    return hold
+
+
+def place_hold(student, book):
+    """
+    Queue ``student`` for ``book``.
+    Returns (outcome, hold); hold is the new or existing waiting hold.
+    """
+    with transaction.atomic():
+        # Serializes holds and requests of the same student
+        ledger = lock_ledger(student.pk, book.pk)
+        hold = BookHold.objects.filter(student=student, book=book, status='waiting').first()
+        if hold is not None:
+            return ALREADY_HOLDING, hold
+        if ledger.has_open_request:
+            return ALREADY_OPEN, None
+        if Book.objects.filter(pk=book.pk, available_copies__gt=0).exists():
+            return AVAILABLE, None
+        hold = BookHold.objects.create(book=book, student=student)
+    return PLACED, hold
+
+
+def cancel_hold(student, hold_id):
+    """Leave the queue; returns whether a waiting hold was cancelled"""
+    return BookHold.objects.filter(pk=hold_id, student=student, status='waiting').update(status='cancelled') == 1
+
+
+def reserved_request_ids(request_ids):
+    """Ids among ``request_ids`` whose copy was set aside by ``promote_holds``"""
+    return set(
+        BookHold.objects.filter(issue_request_id__in=request_ids, status='fulfilled')
+        .values_list('issue_request_id', flat=True)
+    )
+
+
+def promote_holds(book_id, copies=1):
+    """
+    Turn up to ``copies`` of the oldest waiting holds on a book into pending
+    issue requests, each with a copy taken off the shelf for it. Students
+    who cannot borrow right now (unpaid fines, quota reached) keep their
+    place. Returns the promoted holds.
+    """
+    promoted = []
+    with transaction.atomic():
+        available = (
+            Book.objects.select_for_update()
+            .filter(pk=book_id)
+            .values_list('available_copies', flat=True)
+            .first()
+        )
+        copies = min(copies, available or 0)
+        if copies <= 0:
+            return promoted
+        holds = (
+            BookHold.objects.select_for_update()
+            .filter(book_id=book_id, status='waiting')
+            .select_related('book', 'student')
+            .order_by('created_at', 'id')
+        )
+        for hold in holds:
+            if len(promoted) >= copies:
+                break
+            outcome, issue_request = admit_request(hold.student, hold.book)
+            if outcome == DUPLICATE:
+                # The student got the book some other way
+                hold.status = 'fulfilled'
+                hold.save(update_fields=['status', 'updated_at'])
+                continue
+            if outcome != ADMITTED:
+                continue
+            hold.status = 'fulfilled'
+            hold.issue_request = issue_request
+            hold.save(update_fields=['status', 'issue_request', 'updated_at'])
+            promoted.append(hold)
+
+        if promoted:
+            Book.objects.filter(pk=book_id).update(
+                available_copies=F('available_copies') - len(promoted),
+                updated_at=timezone.now(),
+            )
+        enqueue_many('hold_ready', [
+            (hold.student_id, {'book_title': hold.book.title}) for hold in promoted
+        ])
+    return promoted
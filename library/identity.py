@@ -0,0 +1,106 @@
+"""
+Identity of the logged in admin or student.
+
+The custom auth keeps a single typed principal in the session,
+``session['principal'] = ['student', <pk>]`` (or ``['admin', <pk>]``), so
+the session stays small enough for a signed cookie and never has to be
+rewritten on an ordinary page view. Views used to load the row again with
+a primary key lookup. Loaded rows are now memoized per request on
+``request.library_user`` and kept in the cache for ``IDENTITY_CACHE_TTL``
+seconds. The ``Student`` and ``Admin`` save/delete signals in
+``library.signals`` drop the cached copy.
+
+Dropping the copy only reaches every worker through a shared cache, so
+without one ``IDENTITY_CACHE_TTL`` is 0 and rows are not cached across
+requests. Code that writes to a loaded row saves only the columns it
+changed, since the row may be up to ``IDENTITY_CACHE_TTL`` seconds old.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+
+from .models import Admin, Student
+
+MODELS = {
+    'student': Student,
+    'admin': Admin,
+}
+
+
+PRINCIPAL_KEY = 'principal'
+
+
+def get_principal(session):
+    """(kind, pk) of the logged in admin/student, or (None, None)"""
+    principal = session.get(PRINCIPAL_KEY)
+    if not principal:
+        return None, None
+    return principal[0], principal[1]
+
+
+def principal_id(session, kind):
+    """Primary key of the logged in ``kind`` ('admin' or 'student'), or None"""
+    principal_kind, pk = get_principal(session)
+    return pk if principal_kind == kind else None
+
+
+def set_principal(session, kind, pk):
+    """Log ``kind`` ``pk`` in, replacing whoever was logged in before"""
+    session[PRINCIPAL_KEY] = [kind, pk]
+
+
+def identity_cache_key(kind, pk):
+    return f'library:identity:{kind}:{pk}'
+
+
+def load_identity(kind, pk):
+    """Fetch an admin or student by id, from the cache when possible"""
+    if not pk:
+        return None
+    timeout = getattr(settings, 'IDENTITY_CACHE_TTL', 60)
+    if not timeout:
+        return MODELS[kind].objects.filter(pk=pk).first()
+    key = identity_cache_key(kind, pk)
+    instance = cache.get(key)
+    if instance is None:
+        instance = MODELS[kind].objects.filter(pk=pk).first()
+        if instance is None:
+            return None
+        cache.set(key, instance, timeout=timeout)
+    return instance
+
+
+def forget_identity(kind, pk):
+    """Drop the cached copy of an admin or student"""
+    cache.delete(identity_cache_key(kind, pk))
+
+
+class LibraryUser:
+    """Lazy, per-request view of the logged in admin/student"""
+
+    def __init__(self, session):
+        self.session = session
+
+    @cached_property
+    def principal(self):
+        return get_principal(self.session)
+
+    @property
+    def kind(self):
+        return self.principal[0]
+
+    @cached_property
+    def student(self):
+        return load_identity('student', self.principal[1] if self.is_student else None)
+
+    @cached_property
+    def admin(self):
+        return load_identity('admin', self.principal[1] if self.is_admin else None)
+
+    @property
+    def is_student(self):
+        return self.kind == 'student'
+
+    @property
+    def is_admin(self):
+        return self.kind == 'admin'
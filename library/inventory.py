@@ -0,0 +1,239 @@
+"""
+Copy accounting for the circulation desk.
+
+``Book.available_copies`` is only ever changed with conditional
+``UPDATE ... SET available_copies = available_copies +/- 1`` statements,
+and the issue request being processed is locked with ``select_for_update``,
+so concurrent admins can neither oversubscribe a book nor process the same
+request twice. Returned copies are offered to the book's hold queue
+(``library.holds``) in the same transaction; requests promoted from a hold
+already own their copy.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import ledger, stats
+from .fines import accrue_fine, accrue_fines
+from .holds import promote_holds, reserved_request_ids
+from .notifications import enqueue, enqueue_many
+from .models import Book, IssueRequest
+
+# Outcomes of checkout_issue_request / checkin_issue_request
+ISSUED = 'issued'
+RETURNED = 'returned'
+UNAVAILABLE = 'unavailable'
+STALE = 'stale'
+
+
+def reserve_copy(book_id, count=1):
+    """Take copies of a book if enough are available; returns whether it succeeded"""
+    return Book.objects.filter(pk=book_id, available_copies__gte=count).update(
+        available_copies=F('available_copies') - count,
+        updated_at=timezone.now(),
+    ) == 1
+
+
+def release_copy(book_id, count=1):
+    """Put copies of a book back on the shelf"""
+    Book.objects.filter(pk=book_id).update(
+        available_copies=F('available_copies') + count,
+        updated_at=timezone.now(),
+    )
+
+
+def checkout_issue_request(request_id):
+    """
+    Issue the book of a pending request.
+    Returns (outcome, issue_request): ISSUED on success, UNAVAILABLE if no
+    copy is left, STALE if the request is no longer pending.
+    """
+    with transaction.atomic():
+        issue_request = (
+            IssueRequest.objects.select_for_update()
+            .filter(id=request_id, status='requested')
+            .first()
+        )
+        if issue_request is None:
+            return STALE, None
+        reserved = issue_request.id in reserved_request_ids([issue_request.id])
+        if not reserved and not reserve_copy(issue_request.book_id):
+            return UNAVAILABLE, issue_request
+
+        today = timezone.now().date()
+        issue_request.status = 'issued'
+        issue_request.issue_date = today
+        issue_request.expected_return_date = today + timedelta(
+            days=getattr(settings, 'DEFAULT_ISSUE_DAYS', 14)
+        )
+        issue_request.save(update_fields=['status', 'issue_date', 'expected_return_date', 'updated_at'])
+        enqueue(
+            'issue_accepted', issue_request.student_id,
+            book_title=issue_request.book.title, due_date=str(issue_request.expected_return_date),
+        )
+    return ISSUED, issue_request
+
+
+def checkin_issue_request(request_id):
+    """
+    Return the book of an issued (or overdue) request and accrue its fine.
+    Returns (outcome, issue_request, fine): RETURNED on success, STALE if the
+    request is not out on loan any more.
+    """
+    with transaction.atomic():
+        issue_request = (
+            IssueRequest.objects.select_for_update()
+            .filter(id=request_id, status__in=['issued', 'overdue'])
+            .first()
+        )
+        if issue_request is None:
+            return STALE, None, None
+
+        issue_request.update_overdue_status()
+        fine = accrue_fine(issue_request)
+
+        issue_request.status = 'returned'
+        issue_request.actual_return_date = timezone.now().date()
+        issue_request.save(update_fields=['status', 'actual_return_date', 'updated_at'])
+        release_copy(issue_request.book_id)
+        promote_holds(issue_request.book_id)
+        enqueue('return_processed', issue_request.student_id, book_title=issue_request.book.title)
+    return RETURNED, issue_request, fine
+
+
+# ---------- batch operations for the circulation desk ----------
+
+def _lock_requests(request_ids, statuses):
+    """Lock the given requests that are still in one of ``statuses``, oldest first"""
+    return list(
+        IssueRequest.objects.select_for_update()
+        .filter(id__in=request_ids, status__in=statuses)
+        .order_by('request_date', 'id')
+        .values_list('id', 'book_id', 'student_id', 'status')
+    )
+
+
+def _students_and_titles(request_ids):
+    return IssueRequest.objects.filter(id__in=request_ids).values_list('student_id', 'book__title')
+
+
+def checkout_issue_requests(request_ids):
+    """
+    Issue a batch of pending requests in one transaction.
+    Copies are handed out per book in request order; requests for books
+    that run out are left pending. Requests promoted from a hold always go
+    through with the copy set aside for them. Returns a dict of issued,
+    unavailable and stale request ids.
+    """
+    request_ids = set(request_ids)
+    with transaction.atomic():
+        rows = _lock_requests(request_ids, ['requested'])
+        reserved = reserved_request_ids([row[0] for row in rows])
+        book_ids = {book_id for _, book_id, _, _ in rows}
+        available = dict(
+            Book.objects.select_for_update()
+            .filter(id__in=book_ids)
+            .values_list('id', 'available_copies')
+        )
+
+        issued, unavailable = [], []
+        taken = {}
+        for request_id, book_id, _, _ in rows:
+            if request_id in reserved:
+                issued.append(request_id)
+            elif taken.get(book_id, 0) < available.get(book_id, 0):
+                taken[book_id] = taken.get(book_id, 0) + 1
+                issued.append(request_id)
+            else:
+                unavailable.append(request_id)
+
+        if issued:
+            today = timezone.now().date()
+            due_date = today + timedelta(days=getattr(settings, 'DEFAULT_ISSUE_DAYS', 14))
+            IssueRequest.objects.filter(id__in=issued).update(
+                status='issued',
+                issue_date=today,
+                expected_return_date=due_date,
+                updated_at=timezone.now(),
+            )
+            enqueue_many('issue_accepted', [
+                (student_id, {'book_title': title, 'due_date': str(due_date)})
+                for student_id, title in _students_and_titles(issued)
+            ])
+            for book_id, count in taken.items():
+                reserve_copy(book_id, count)
+            ledger.rebuild({student_id for request_id, _, student_id, _ in rows if request_id in issued})
+
+    stats.adjust(**stats.issue_status_deltas('requested', 'issued', len(issued)))
+    stale = sorted(request_ids - {request_id for request_id, _, _, _ in rows})
+    return {'issued': issued, 'unavailable': unavailable, 'stale': stale}
+
+
+def reject_issue_requests(request_ids):
+    """
+    Reject a batch of pending requests; returns the number rejected.
+    Copies set aside for promoted holds go to the next hold in the queue.
+    """
+    with transaction.atomic():
+        rows = _lock_requests(request_ids, ['requested'])
+        reserved = reserved_request_ids([row[0] for row in rows])
+        rejected = IssueRequest.objects.filter(id__in=[row[0] for row in rows]).update(
+            status='rejected',
+            updated_at=timezone.now(),
+        )
+        ledger.rebuild({student_id for _, _, student_id, _ in rows})
+        released = {}
+        for request_id, book_id, _, _ in rows:
+            if request_id in reserved:
+                released[book_id] = released.get(book_id, 0) + 1
+        for book_id, count in released.items():
+            release_copy(book_id, count)
+            promote_holds(book_id, count)
+    stats.adjust(requested=-rejected)
+    return rejected
+
+
+def checkin_issue_requests(request_ids):
+    """
+    Return a batch of issued/overdue books in one transaction, accruing
+    overdue fines for them first. Returns a dict of returned and stale
+    request ids and the number of fines created or updated.
+    """
+    request_ids = set(request_ids)
+    with transaction.atomic():
+        rows = _lock_requests(request_ids, ['issued', 'overdue'])
+        returned = [request_id for request_id, _, _, _ in rows]
+        fines = accrue_fines(returned) if returned else {'fines_created': 0, 'fines_updated': 0}
+
+        if returned:
+            IssueRequest.objects.filter(id__in=returned).update(
+                status='returned',
+                actual_return_date=timezone.now().date(),
+                updated_at=timezone.now(),
+            )
+            released = {}
+            for _, book_id, _, _ in rows:
+                released[book_id] = released.get(book_id, 0) + 1
+            for book_id, count in released.items():
+                release_copy(book_id, count)
+            ledger.rebuild({student_id for _, _, student_id, _ in rows})
+            for book_id, count in released.items():
+                promote_holds(book_id, count)
+            enqueue_many('return_processed', [
+                (student_id, {'book_title': title})
+                for student_id, title in _students_and_titles(returned)
+            ])
+
+    for status in ('issued', 'overdue'):
+        count = sum(1 for _, _, _, row_status in rows if row_status == status)
+        stats.adjust(**stats.issue_status_deltas(status, 'returned', count))
+
+    stale = sorted(request_ids - set(returned))
+    return {
+        'returned': returned,
+        'stale': stale,
+        'fines': fines['fines_created'] + fines['fines_updated'],
+    }
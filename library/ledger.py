@@ -0,0 +1,106 @@
+"""
+Per-student loan and fine summary.
+
+``StudentLedger`` keeps one row per student with the outstanding fine total
+and the number of active loans, pending requests and overdue loans, so
+``Student.total_fines`` and ``Student.active_issues_count`` are a primary
+key read instead of an aggregate over the student's history.
+
+Single-row saves adjust the ledger with ``F()`` updates from the model
+signals in ``library.signals``, inside the same transaction as the change.
+Bulk operations, which bypass signals, call ``rebuild`` for the students
+they touched. A missing ledger row is built on first read, and
+``manage.py rebuild_ledgers`` recomputes every row.
+"""
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import Fine, IssueRequest, StudentLedger
+
+# IssueRequest status -> ledger counter
+STATUS_FIELDS = {
+    'issued': 'active_loans',
+    'requested': 'pending_requests',
+    'overdue': 'overdue_count',
+}
+
+UPDATE_FIELDS = ['outstanding_fines', 'active_loans', 'pending_requests', 'overdue_count', 'updated_at']
+
+
+def compute(student_ids):
+    """Ledger rows for ``student_ids`` computed from the database"""
+    student_ids = set(student_ids)
+    rows = {
+        student_id: StudentLedger(student_id=student_id, updated_at=timezone.now())
+        for student_id in student_ids
+    }
+    counts = (
+        IssueRequest.objects.filter(student_id__in=student_ids, status__in=STATUS_FIELDS)
+        .order_by()
+        .values('student_id')
+        .annotate(**{
+            field: Count('id', filter=Q(status=status))
+            for status, field in STATUS_FIELDS.items()
+        })
+    )
+    for row in counts:
+        for field in STATUS_FIELDS.values():
+            setattr(rows[row['student_id']], field, row[field])
+
+    fines = (
+        Fine.objects.filter(student_id__in=student_ids, is_paid=False)
+        .order_by()
+        .values('student_id')
+        .annotate(total=Sum('amount'))
+    )
+    for row in fines:
+        rows[row['student_id']].outstanding_fines = row['total'] or Decimal('0.00')
+    return list(rows.values())
+
+
+def rebuild(student_ids):
+    """Recompute and upsert the ledger rows of ``student_ids``"""
+    rows = compute(student_ids)
+    if not rows:
+        return []
+    unique_fields = ['student'] if connection.features.supports_update_conflicts_with_target else None
+    StudentLedger.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=unique_fields, update_fields=UPDATE_FIELDS,
+    )
+    return rows
+
+
+def adjust(student_id, **deltas):
+    """Apply deltas to one student's ledger, e.g. adjust(5, active_loans=1, pending_requests=-1)"""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # A missing row is left alone; get_ledger builds it from scratch when read
+    StudentLedger.objects.filter(pk=student_id).update(
+        updated_at=timezone.now(),
+        **{field: F(field) + delta for field, delta in deltas.items()},
+    )
+
+
+def issue_status_deltas(old_status, new_status):
+    """Ledger deltas for one issue request moving from one status to another"""
+    deltas = {}
+    if old_status in STATUS_FIELDS:
+        deltas[STATUS_FIELDS[old_status]] = deltas.get(STATUS_FIELDS[old_status], 0) - 1
+    if new_status in STATUS_FIELDS:
+        deltas[STATUS_FIELDS[new_status]] = deltas.get(STATUS_FIELDS[new_status], 0) + 1
+    return deltas
+
+
+def get_ledger(student):
+    """The ledger row of ``student``, memoized on the instance"""
+    ledger = getattr(student, '_ledger', None)
+    if ledger is None:
+        ledger = StudentLedger.objects.filter(pk=student.pk).first()
+        if ledger is None:
+            ledger = rebuild([student.pk])[0]
+        student._ledger = ledger
+    return ledger
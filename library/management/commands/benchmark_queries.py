@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from library import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a synthetic dataset into a test database, request every library URL '
+        'as admin, student and anonymous, cold and warm, and fail when a query/time/memory budget is exceeded'
+    )
+
+    def add_arguments(self, parser):
+        for name, default in benchmark.DEFAULT_SIZES.items():
+            parser.add_argument(
+                f'--{name}', type=int, default=default,
+                help=f'Number of {name} to seed (default {default})',
+            )
+        parser.add_argument(
+            '--scale', type=float, default=1.0,
+            help='Multiply every dataset size, e.g. 0.01 for a quick run',
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='Measured requests per route and role')
+        parser.add_argument('--route', action='append', dest='routes', help='Only benchmark this URL name')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database after the run')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        sizes = {
+            name: max(int(options[name] * options['scale']), 1)
+            for name in benchmark.DEFAULT_SIZES
+        }
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            self.stdout.write(
+                'Seeding ' + ', '.join(f'{count} {name}' for name, count in sizes.items()) + '...'
+            )
+            fixtures = benchmark.seed(**sizes)
+            results = benchmark.run(fixtures, repeat=options['repeat'], only=options['routes'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(f"{'route':<32}{'role':<11}{'phase':<6}{'status':>6}{'queries':>9}{'ms':>9}{'KiB':>9}")
+            for result in results:
+                line = (
+                    f"{result['route']:<32}{result['role']:<11}{result['phase']:<6}{result['status']:>6}"
+                    f"{result['queries']:>9}{result['time_ms']:>9.1f}{result['memory_kb']:>9.0f}"
+                )
+                if result['failures']:
+                    line = self.style.ERROR(f"{line}  over budget: {', '.join(result['failures'])}")
+                self.stdout.write(line)
+
+        failed = [result for result in results if result['failures']]
+        if failed:
+            raise CommandError(f'{len(failed)} of {len(results)} measurement(s) exceeded their budget')
+        self.stdout.write(self.style.SUCCESS(f'All {len(results)} measurement(s) within budget'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library.query_plans import explain_all
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN over the hot circulation and fine queries and report full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plan', action='store_true', help='Print the full plan of every query')
+        parser.add_argument('--fail', action='store_true', help='Exit with an error if any query does a full scan')
+
+    def handle(self, *args, **options):
+        results = explain_all()
+        flagged = 0
+        for result in results:
+            if result['scans']:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(
+                    f"{result['name']}: full scan of {', '.join(result['scans'])}"
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{result['name']}: uses indexes"))
+            if options['verbose_plan'] or result['scans']:
+                self.stdout.write(f"    {result['sql']}")
+                for row in result['plan']:
+                    self.stdout.write('    ' + ' | '.join(f'{key}={value}' for key, value in row.items()))
+
+        if flagged and options['fail']:
+            raise CommandError(f'{flagged} of {len(results)} hot queries do a full table scan')
+        self.stdout.write(f'{len(results) - flagged} of {len(results)} hot queries use indexes')
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from library.notifications import drain
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued notification events from the outbox in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Events per batch (default NOTIFICATION_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true', help='Keep running and poll the outbox')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to wait between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            # Drop a connection the database closed or that outlived CONN_MAX_AGE
+            close_old_connections()
+            try:
+                processed = drain(batch_size=options['batch_size'])
+            except DatabaseError as error:
+                if not options['loop']:
+                    raise
+                # The connection is replaced on the next iteration
+                self.stderr.write(f'Database error, retrying: {error}')
+                processed = 0
+            if processed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Processed {processed} notification event(s)'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
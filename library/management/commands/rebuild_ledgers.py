@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from library.ledger import rebuild
+from library.models import Student
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Recompute every student ledger (fine total, loans, requests) from the database'
+
+    def handle(self, *args, **options):
+        total = 0
+        last_id = 0
+        while True:
+            student_ids = list(
+                Student.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE]
+            )
+            if not student_ids:
+                break
+            rebuild(student_ids)
+            total += len(student_ids)
+            last_id = student_ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} student ledger(s)'))
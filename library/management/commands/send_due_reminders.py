@@ -0,0 +1,39 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from library.reminders import BATCH_SIZE, send_due_reminders
+
+
+class Command(BaseCommand):
+    help = 'Queue reminders for books due in the next few days (safe to rerun the same day)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Remind about books due within this many days, defaults to DUE_REMINDER_DAYS',
+        )
+        parser.add_argument(
+            '--date',
+            type=date.fromisoformat,
+            default=None,
+            help='Run as of this date (YYYY-MM-DD), defaults to today',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Students queued per transaction',
+        )
+
+    def handle(self, *args, **options):
+        result = send_due_reminders(
+            today=options['date'],
+            days=options['days'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Queued reminders for {result['students']} student(s) covering {result['issues']} issue(s)"
+        ))
@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from library.overdue import sweep_overdue
+
+
+class Command(BaseCommand):
+    help = 'Mark issued books past their due date as overdue and generate their fines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=date.fromisoformat,
+            default=None,
+            help='Run the sweep as of this date (YYYY-MM-DD), defaults to today',
+        )
+
+    def handle(self, *args, **options):
+        result = sweep_overdue(today=options['date'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Marked {result['marked_overdue']} issue(s) overdue, "
+            f"created {result['fines_created']} fine(s), "
+            f"updated {result['fines_updated']} fine(s)"
+        ))
@@ -0,0 +1,21 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .identity import LibraryUser
+
+
+class LibraryUserMiddleware:
+    """Attach the lazily loaded admin/student to ``request.library_user``"""
+
+    # Async capable so async views (the logins) are not forced onto a thread
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.library_user = LibraryUser(request.session)
+        # In async mode this returns the coroutine of the next handler
+        return self.get_response(request)
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_notification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fine',
+            index=models.Index(fields=['student', 'is_paid'], name='fine_student_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fine',
+            index=models.Index(fields=['-created_at'], name='fine_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issuerequest',
+            index=models.Index(fields=['student', 'status'], name='issue_student_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issuerequest',
+            index=models.Index(fields=['book', 'student', 'status'], name='issue_book_student_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issuerequest',
+            index=models.Index(fields=['status', 'expected_return_date'], name='issue_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issuerequest',
+            index=models.Index(fields=['status', '-created_at'], name='issue_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issuerequest',
+            index=models.Index(fields=['-request_date'], name='issue_request_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['status'], name='student_status_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:04
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def build_ledgers(apps, schema_editor):
+    Student = apps.get_model('library', 'Student')
+    IssueRequest = apps.get_model('library', 'IssueRequest')
+    Fine = apps.get_model('library', 'Fine')
+    StudentLedger = apps.get_model('library', 'StudentLedger')
+
+    ledgers = {pk: StudentLedger(student_id=pk) for pk in Student.objects.values_list('pk', flat=True)}
+    counts = IssueRequest.objects.order_by().values('student_id').annotate(
+        active_loans=Count('id', filter=Q(status='issued')),
+        pending_requests=Count('id', filter=Q(status='requested')),
+        overdue_count=Count('id', filter=Q(status='overdue')),
+    )
+    for row in counts:
+        ledger = ledgers[row['student_id']]
+        ledger.active_loans = row['active_loans']
+        ledger.pending_requests = row['pending_requests']
+        ledger.overdue_count = row['overdue_count']
+    fines = Fine.objects.filter(is_paid=False).order_by().values('student_id').annotate(total=Sum('amount'))
+    for row in fines:
+        ledgers[row['student_id']].outstanding_fines = row['total'] or Decimal('0.00')
+    StudentLedger.objects.bulk_create(ledgers.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentLedger',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger', serialize=False, to='library.student')),
+                ('outstanding_fines', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('active_loans', models.IntegerField(default=0)),
+                ('pending_requests', models.IntegerField(default=0)),
+                ('overdue_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'library_studentledger',
+            },
+        ),
+        migrations.RunPython(build_ledgers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_studentledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='student',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='library.student'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('fine', 'Fine'), ('issue', 'Book Issue'), ('return', 'Book Return'), ('hold', 'Book Hold'), ('general', 'General')], default='general', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='BookHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('fulfilled', 'Fulfilled'), ('cancelled', 'Cancelled')], default='waiting', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='library.book')),
+                ('issue_request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='holds', to='library.issuerequest')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='library.student')),
+            ],
+            options={
+                'db_table': 'library_bookhold',
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['book', 'status', 'created_at'], name='hold_book_status_created_idx'), models.Index(fields=['student', 'status'], name='hold_student_status_idx')],
+            },
+        ),
+    ]
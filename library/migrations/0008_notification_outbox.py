@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_book_holds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('issue_accepted', 'Issue Accepted'), ('return_processed', 'Return Processed'), ('fine_created', 'Fine Created'), ('due_reminder', 'Due Date Reminder'), ('hold_ready', 'Hold Ready')], max_length=30)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox_events', to='library.student')),
+            ],
+            options={
+                'db_table': 'library_notificationoutbox',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='outbox_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_notification_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['student', 'is_read'], name='notif_student_read_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['student', '-created_at'], name='notif_student_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0009_notification_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issuerequest',
+            name='reminder_sent_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
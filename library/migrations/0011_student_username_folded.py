@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+def fold_usernames(apps, schema_editor):
+    # Folded in Python with library.availability.fold() itself: SQL TRIM/LOWER
+    # strip and lowercase differently, and lookups must match exactly
+    from library.availability import fold
+
+    Student = apps.get_model('library', 'Student')
+    batch = []
+    for pk, username in Student.objects.values_list('id', 'username').iterator(chunk_size=2000):
+        batch.append(Student(id=pk, username_folded=fold(username)))
+        if len(batch) >= 2000:
+            Student.objects.bulk_update(batch, ['username_folded'])
+            batch = []
+    Student.objects.bulk_update(batch, ['username_folded'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0010_issue_reminder_sent_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='username_folded',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(fold_usernames, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_student_username_folded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='outbox_event',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='library.notificationoutbox'),
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0012_notification_delivery_retry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='delivered_channels',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
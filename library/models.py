@@ -1,10 +1,13 @@
 from django.db import models
 from django.utils import timezone
-from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.auth.hashers import make_password
 from datetime import timedelta
 from decimal import Decimal
 from django.contrib.auth import get_user_model
 
+from . import activity, passwords
+from .availability import fold
+
 class Admin(models.Model):
     """Admin users with static credentials"""
     username = models.CharField(max_length=50, unique=True)
@@ -22,18 +25,33 @@ class Admin(models.Model):
         return self.username
 
     def set_password(self, raw_password):
-        """Hash and set password"""
+        """Hash and set password, writing only the password column of a saved row"""
         self.password = make_password(raw_password)
-        self.save()
+        if self.pk is None:
+            self.save()
+        else:
+            self.save(update_fields=['password'])
 
     def check_password(self, raw_password):
-        """Check if password is correct"""
-        return check_password(raw_password, self.password)
+        """Check if password is correct, upgrading an outdated hash"""
+        valid, rehashed = passwords.verify(raw_password, self.password)
+        if rehashed:
+            self.password = rehashed
+            self.save(update_fields=['password'])
+        return valid
+
+    async def acheck_password(self, raw_password):
+        """check_password for async views"""
+        valid, rehashed = await passwords.averify(raw_password, self.password)
+        if rehashed:
+            self.password = rehashed
+            await self.asave(update_fields=['password'])
+        return valid
 
     def update_last_login(self):
-        """Update last login timestamp"""
+        """Update last login timestamp (buffered, see library.activity)"""
         self.last_login = timezone.now()
-        self.save()
+        activity.record_login('admin', self.pk, self.last_login)
 
 
 class Author(models.Model):
@@ -79,19 +97,40 @@ class Book(models.Model):
         if not student:
             return None
         
-        active_request = IssueRequest.objects.filter(
-            book=self,
-            student=student,
-            status__in=['requested', 'issued']
-        ).first()
+        Book.annotate_status_for_student([self], student)
+        return self.student_status
+
+    def _status_label(self, active_status):
+        if active_status == 'requested':
+            return 'issue requested'
+        elif active_status in ('issued', 'overdue'):
+            # An overdue book is still out with the student
+            return 'issued'
+        return 'request issue' if self.is_available() else 'not available'
+
+    @staticmethod
+    def annotate_status_for_student(books, student):
+        """
+        Set ``student_status`` on every book for the given student using a
+        single query over that student's active requests.
+        """
+        books = list(books)
+        if not student:
+            for book in books:
+                book.student_status = None
+            return books
         
-        if active_request:
-            if active_request.status == 'requested':
-                return 'issue requested'
-            elif active_request.status == 'issued':
-                return 'issued'
+        active = dict(
+            IssueRequest.objects.filter(
+                student=student,
+                book_id__in=[book.pk for book in books],
+                status__in=['requested', 'issued', 'overdue'],
+            ).values_list('book_id', 'status')
+        ) if books else {}
         
-        return 'request issue' if self.is_available() else 'not available'
+        for book in books:
+            book.student_status = book._status_label(active.get(book.pk))
+        return books
 
 
 class Student(models.Model):
@@ -110,6 +149,8 @@ class Student(models.Model):
     
     student_id = models.CharField(max_length=20, unique=True)
     username = models.CharField(max_length=50, unique=True)
+    # Case-folded username (availability.fold) for lookups that can use an index
+    username_folded = models.CharField(max_length=50, db_index=True, editable=False, default='')
     password = models.CharField(max_length=255)  # Hashed password
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
@@ -130,40 +171,64 @@ class Student(models.Model):
     class Meta:
         db_table = 'library_student'
         ordering = ['student_id']
+        indexes = [
+            models.Index(fields=['status'], name='student_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.student_id} - {self.full_name}"
 
+    def save(self, *args, **kwargs):
+        self.username_folded = fold(self.username)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'username' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'username_folded'}
+        super().save(*args, **kwargs)
+
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
 
     def set_password(self, raw_password):
-        """Hash and set password"""
+        """Hash and set password, writing only the password column of a saved row"""
         self.password = make_password(raw_password)
-        self.save()
+        if self.pk is None:
+            self.save()
+        else:
+            self.save(update_fields=['password'])
 
     def check_password(self, raw_password):
-        """Check if password is correct"""
-        return check_password(raw_password, self.password)
+        """Check if password is correct, upgrading an outdated hash"""
+        valid, rehashed = passwords.verify(raw_password, self.password)
+        if rehashed:
+            self.password = rehashed
+            self.save(update_fields=['password'])
+        return valid
+
+    async def acheck_password(self, raw_password):
+        """check_password for async views"""
+        valid, rehashed = await passwords.averify(raw_password, self.password)
+        if rehashed:
+            self.password = rehashed
+            await self.asave(update_fields=['password'])
+        return valid
 
     def update_last_login(self):
-        """Update last login timestamp"""
+        """Update last login timestamp (buffered, see library.activity)"""
         self.last_login = timezone.now()
-        self.save()
+        activity.record_login('student', self.pk, self.last_login)
 
    
     @property
     def total_fines(self):
-        if hasattr(self, 'fines'):
-            return self.fines.filter(is_paid=False).aggregate(
-                total=models.Sum('amount')
-            )['total'] or Decimal('0.00')
-        return Decimal('0.00')
+        from .ledger import get_ledger
+        return get_ledger(self).outstanding_fines
 
     @property
     def active_issues_count(self):
-        return self.issuerequest_set.filter(status='issued').count()
+        from .ledger import get_ledger
+        ledger = get_ledger(self)
+        return ledger.active_loans + ledger.overdue_count
 
 
 class IssueRequest(models.Model):
@@ -182,6 +247,7 @@ class IssueRequest(models.Model):
     return_date = models.DateField(null=True, blank=True)
     expected_return_date = models.DateField(null=True, blank=True)
     actual_return_date = models.DateField(null=True, blank=True)
+    reminder_sent_on = models.DateField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='requested')
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -190,6 +256,17 @@ class IssueRequest(models.Model):
     class Meta:
         db_table = 'library_issuerequest'
         ordering = ['-request_date']
+        indexes = [
+            # A student's loans by status (dashboard, eligibility checks)
+            models.Index(fields=['student', 'status'], name='issue_student_status_idx'),
+            # Duplicate request / per-book status lookups
+            models.Index(fields=['book', 'student', 'status'], name='issue_book_student_status_idx'),
+            # Overdue sweep, fine accrual and due-date ranges
+            models.Index(fields=['status', 'expected_return_date'], name='issue_status_due_idx'),
+            # Circulation desk pages, filtered by status and newest first
+            models.Index(fields=['status', '-created_at'], name='issue_status_created_idx'),
+            models.Index(fields=['-request_date'], name='issue_request_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.book.title} - {self.student.student_id}"
@@ -209,21 +286,18 @@ class IssueRequest(models.Model):
         return timezone.now().date() > self.expected_return_date
 
     def calculate_overdue_fine(self):
-        """Calculate fine for overdue book (5 tk per day)"""
-        if self.status not in ['issued', 'overdue'] or not self.expected_return_date:
+        """Calculate fine for overdue book (FINE_PER_DAY tk per day)"""
+        from .fines import calculate_fine, days_overdue
+
+        if self.status not in ['issued', 'overdue']:
             return 0
-        
-        today = timezone.now().date()
-        if today > self.expected_return_date:
-            days_overdue = (today - self.expected_return_date).days
-            return days_overdue * 5  # 5 tk per day
-        return 0
+        return calculate_fine(days_overdue(self.expected_return_date))
     
     def update_overdue_status(self):
         """Update status to overdue if book is past due date"""
         if self.status == 'issued' and self.is_overdue:
             self.status = 'overdue'
-            self.save()
+            self.save(update_fields=['status', 'updated_at'])
     
     def save(self, *args, **kwargs):
         if self.status == 'issued' and not self.expected_return_date:
@@ -234,48 +308,16 @@ class IssueRequest(models.Model):
         if self.status == 'issued' and self.is_overdue:
             self.status = 'overdue'
         
+        # Fines are accrued in bulk by library.fines (see the overdue sweeper)
         super().save(*args, **kwargs)
-        
-        # Auto-generate fine if overdue
-        if self.status == 'overdue':
-            self.auto_generate_fine()
     
     def auto_generate_fine(self):
-        """Automatically generate fine for overdue books"""
-        from django.conf import settings
-        from decimal import Decimal
-        import uuid
-        
-        if self.status != 'overdue' or not self.expected_return_date:
-            return
-        
-        today = timezone.now().date()
-        if today > self.expected_return_date:
-            days_overdue = (today - self.expected_return_date).days
-            fine_amount = Decimal(days_overdue) * Decimal('5')  # 5 tk per day
-            
-            # Generate unique invoice number
-            timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
-            invoice_number = f"INV-AUTO-{self.id}-{timestamp}"
-            
-            # Create or update fine
-            fine, created = Fine.objects.get_or_create(
-                issue_request=self,
-                defaults={
-                    'student': self.student,
-                    'amount': fine_amount,
-                    'days_overdue': days_overdue,
-                    'description': f'Overdue fine for {days_overdue} days',
-                    'invoice_number': invoice_number,
-                }
-            )
-            
-            # Update fine if it already exists and days have increased
-            if not created and fine.days_overdue < days_overdue:
-                fine.amount = fine_amount
-                fine.days_overdue = days_overdue
-                fine.description = f'Overdue fine for {days_overdue} days'
-                fine.save()
+        """Accrue the fine for this issue through the batched fine engine"""
+        from .fines import accrue_fine
+
+        if self.status != 'overdue':
+            return None
+        return accrue_fine(self)
 
 
 class Fine(models.Model):
@@ -303,6 +345,10 @@ class Fine(models.Model):
     class Meta:
         db_table = 'library_fine'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['student', 'is_paid'], name='fine_student_paid_idx'),
+            models.Index(fields=['-created_at'], name='fine_created_idx'),
+        ]
 
     def __str__(self):
         return f"Fine: {self.student.student_id} - ৳{self.amount}"
@@ -318,32 +364,127 @@ class Fine(models.Model):
         self.save()
 
 
+class BookHold(models.Model):
+    """A student's place in the queue for a book with no copies left"""
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('fulfilled', 'Fulfilled'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holds')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='holds')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting')
+    issue_request = models.ForeignKey(IssueRequest, on_delete=models.SET_NULL, null=True, blank=True, related_name='holds')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'library_bookhold'
+        ordering = ['created_at', 'id']
+        indexes = [
+            # Queue order of a book and position lookups
+            models.Index(fields=['book', 'status', 'created_at'], name='hold_book_status_created_idx'),
+            models.Index(fields=['student', 'status'], name='hold_student_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Hold: {self.book_id} - {self.student_id} ({self.status})"
+
+
+class StudentLedger(models.Model):
+    """Per-student loan and fine totals, maintained by library.ledger"""
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, primary_key=True, related_name='ledger')
+    outstanding_fines = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    active_loans = models.IntegerField(default=0)
+    pending_requests = models.IntegerField(default=0)
+    overdue_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'library_studentledger'
+
+    def __str__(self):
+        return f"Ledger: {self.student_id}"
+
+
 class Notification(models.Model):
     """System notifications for users"""
     NOTIFICATION_TYPES = [
         ('fine', 'Fine'),
         ('issue', 'Book Issue'),
         ('return', 'Book Return'),
+        ('hold', 'Book Hold'),
         ('general', 'General'),
     ]
     
-    user = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='notifications')
+    # Students are not auth users, so a notification targets either one
+    user = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
     title = models.CharField(max_length=200)
     message = models.TextField()
     notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES, default='general')
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     read_at = models.DateTimeField(null=True, blank=True)
+    # Outbox event this notification was rendered from, so a retried delivery reuses it
+    outbox_event = models.ForeignKey(
+        'NotificationOutbox', on_delete=models.SET_NULL, related_name='notifications', null=True, blank=True,
+    )
 
     class Meta:
         ordering = ['-created_at']
         db_table = 'library_notification'
+        indexes = [
+            models.Index(fields=['student', 'is_read'], name='notif_student_read_idx'),
+            models.Index(fields=['student', '-created_at'], name='notif_student_created_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.title} - {self.user.username}"
+        recipient = self.student.username if self.student_id else self.user.username
+        return f"{self.title} - {recipient}"
 
     def mark_as_read(self):
         if not self.is_read:
             self.is_read = True
             self.read_at = timezone.now()
-            self.save()
\ No newline at end of file
+            self.save()
+
+class NotificationOutbox(models.Model):
+    """Notification events waiting for the delivery worker (library.notifications)"""
+    EVENT_TYPES = [
+        ('issue_accepted', 'Issue Accepted'),
+        ('return_processed', 'Return Processed'),
+        ('fine_created', 'Fine Created'),
+        ('due_reminder', 'Due Date Reminder'),
+        ('hold_ready', 'Hold Ready'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    event_type = models.CharField(max_length=30, choices=EVENT_TYPES)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='outbox_events')
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Not claimed again before this time (delivery in progress or retry backoff)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    # NOTIFICATION_CHANNELS entries that already delivered this event
+    delivered_channels = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'library_notificationoutbox'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='outbox_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} - {self.student_id} ({self.status})"
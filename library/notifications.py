@@ -0,0 +1,277 @@
+"""
+Notification outbox.
+
+Views and circulation services only ``enqueue`` an event: one row in
+``NotificationOutbox``, written in the same transaction as the change that
+caused it. The ``process_notifications`` worker drains the outbox in
+batches. For each batch it renders the events, writes the ``Notification``
+rows with one ``bulk_create``, and hands them to the delivery channels
+listed in ``NOTIFICATION_CHANNELS`` (email through ``EMAIL_HOST`` by
+default). No notification work happens during a request.
+
+Delivery is tracked per event and per channel. A channel reports which
+notifications it could not deliver; an event is marked sent once every
+channel delivered it, and the channels that did are recorded on the event.
+While a worker delivers, its events are held for
+``NOTIFICATION_DELIVERY_TIMEOUT`` seconds. Events that failed are retried
+after ``NOTIFICATION_RETRY_DELAY`` seconds, doubled per attempt, up to
+``MAX_ATTEMPTS``, through the channels they have not reached yet, reusing
+the in-app notification already written for them.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .feed import notify_changed_on_commit
+from .models import Notification, NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+
+# ---------- events ----------
+
+def _issue_accepted(payload):
+    return (
+        'issue',
+        'Book issued',
+        f'"{payload["book_title"]}" has been issued to you. Please return it by {payload["due_date"]}.',
+    )
+
+
+def _return_processed(payload):
+    return 'return', 'Book returned', f'Your return of "{payload["book_title"]}" has been processed. Thank you!'
+
+
+def _fine_created(payload):
+    return (
+        'fine',
+        'New Fine Issued',
+        f'A fine of ৳{payload["amount"]} has been issued to your account. Reason: {payload["description"]}',
+    )
+
+
+def _due_reminder(payload):
+    books = payload['books']
+    if len(books) == 1:
+        title, due_date = books[0]
+        return 'issue', 'Book due soon', f'"{title}" is due on {due_date}. Please return it to avoid a fine.'
+    listing = ', '.join(f'"{title}" (due {due_date})' for title, due_date in books)
+    return 'issue', 'Books due soon', f'{len(books)} of your books are due soon: {listing}. Please return them to avoid a fine.'
+
+
+def _hold_ready(payload):
+    return (
+        'hold',
+        'Your hold is ready',
+        f'A copy of "{payload["book_title"]}" was returned and a request has been placed for you. '
+        'It will be issued once the library approves it.',
+    )
+
+
+RENDERERS = {
+    'issue_accepted': _issue_accepted,
+    'return_processed': _return_processed,
+    'fine_created': _fine_created,
+    'due_reminder': _due_reminder,
+    'hold_ready': _hold_ready,
+}
+
+
+def enqueue(event_type, student_id, **payload):
+    """Queue one notification event; call it inside the transaction of the change"""
+    return NotificationOutbox.objects.create(event_type=event_type, student_id=student_id, payload=payload)
+
+
+def enqueue_many(event_type, events):
+    """Queue several events of one type from (student_id, payload) pairs"""
+    return NotificationOutbox.objects.bulk_create([
+        NotificationOutbox(event_type=event_type, student_id=student_id, payload=payload)
+        for student_id, payload in events
+    ])
+
+
+# ---------- delivery channels ----------
+
+class Channel:
+    """Delivers saved notifications somewhere outside the database"""
+
+    def deliver(self, notifications):
+        """
+        Deliver ``notifications``; returns {notification id: error} for the
+        ones that failed. Raising means none of them was delivered.
+        """
+        raise NotImplementedError
+
+
+class EmailChannel(Channel):
+    """Sends each notification to the student's email, over one SMTP connection"""
+
+    def deliver(self, notifications):
+        recipients = [
+            notification for notification in notifications
+            if notification.student_id and notification.student.email
+        ]
+        if not recipients:
+            return {}
+        failures = {}
+        with get_connection(fail_silently=False) as email_connection:
+            for notification in recipients:
+                message = EmailMessage(
+                    subject=notification.title,
+                    body=notification.message,
+                    to=[notification.student.email],
+                    connection=email_connection,
+                )
+                try:
+                    message.send()
+                except Exception as error:
+                    logger.warning('Could not email notification %s: %r', notification.id, error)
+                    failures[notification.id] = error
+        return failures
+
+
+_channels = None
+
+
+def get_channels():
+    """(path, channel) for every entry of NOTIFICATION_CHANNELS"""
+    global _channels
+    if _channels is None:
+        _channels = [(path, import_string(path)()) for path in getattr(settings, 'NOTIFICATION_CHANNELS', [])]
+    return _channels
+
+
+# ---------- worker ----------
+
+def _claim(batch_size):
+    """Lock the next due pending events; concurrent workers skip each other's rows"""
+    pending = (
+        NotificationOutbox.objects.filter(status='pending')
+        .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now()))
+        .select_related('student')
+        .order_by('id')
+    )
+    if connection.features.has_select_for_update_skip_locked:
+        pending = pending.select_for_update(skip_locked=True, of=('self',))
+    elif connection.features.has_select_for_update:
+        pending = pending.select_for_update()
+    return list(pending[:batch_size])
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_RETRY_DELAY', 60) * 2 ** (attempts - 1))
+
+
+def _record_failure(event, error, now):
+    event.attempts += 1
+    event.last_error = repr(error)
+    event.status = 'failed' if event.attempts >= MAX_ATTEMPTS else 'pending'
+    event.next_attempt_at = now + _retry_delay(event.attempts)
+
+
+def _deliver(events):
+    """
+    Run the notification of each event through the channels it has not
+    reached yet, recording successes in ``delivered_channels``.
+    Returns {event id: error} for the events that still need a retry.
+    """
+    notifications = {
+        notification.outbox_event_id: notification
+        for notification in Notification.objects.filter(outbox_event__in=events).select_related('student')
+    }
+    failures = {}
+    for path, channel in get_channels():
+        pending = [
+            (event, notifications[event.id]) for event in events
+            if event.id in notifications and path not in event.delivered_channels
+        ]
+        if not pending:
+            continue
+        try:
+            errors = channel.deliver([notification for _, notification in pending]) or {}
+        except Exception as error:
+            logger.exception('Notification channel %s failed', path)
+            errors = {notification.id: error for _, notification in pending}
+        for event, notification in pending:
+            if notification.id in errors:
+                failures.setdefault(event.id, errors[notification.id])
+            else:
+                event.delivered_channels.append(path)
+    return failures
+
+
+def process_batch(batch_size=None):
+    """
+    Turn one batch of outbox events into notifications and deliver them.
+    Returns the number of events processed.
+    """
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_BATCH_SIZE', 200)
+    with transaction.atomic():
+        events = _claim(batch_size)
+        if not events:
+            return 0
+
+        now = timezone.now()
+        rendered = set(
+            Notification.objects.filter(outbox_event__in=events).values_list('outbox_event_id', flat=True)
+        )
+        notifications, delivering, failed = [], [], []
+        for event in events:
+            if event.id not in rendered:
+                try:
+                    notification_type, title, message = RENDERERS[event.event_type](event.payload)
+                except Exception as error:
+                    _record_failure(event, error, now)
+                    failed.append(event)
+                    continue
+                notifications.append(Notification(
+                    student=event.student,
+                    title=title,
+                    message=message,
+                    notification_type=notification_type,
+                    outbox_event=event,
+                ))
+            # Held until delivered; a worker that dies releases them after the timeout
+            event.next_attempt_at = now + timedelta(seconds=getattr(settings, 'NOTIFICATION_DELIVERY_TIMEOUT', 300))
+            delivering.append(event)
+
+        Notification.objects.bulk_create(notifications)
+        notify_changed_on_commit(notification.student_id for notification in notifications)
+        NotificationOutbox.objects.bulk_update(delivering + failed, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+    # Outside the transaction: a slow or failing channel never holds the outbox locks
+    if delivering:
+        failures = _deliver(delivering)
+        now = timezone.now()
+        for event in delivering:
+            if event.id in failures:
+                _record_failure(event, failures[event.id], now)
+            else:
+                event.status = 'sent'
+                event.processed_at = now
+                event.next_attempt_at = None
+        NotificationOutbox.objects.bulk_update(
+            delivering,
+            ['attempts', 'last_error', 'status', 'next_attempt_at', 'processed_at', 'delivered_channels'],
+        )
+    return len(events)
+
+
+def drain(batch_size=None, max_batches=None):
+    """Process batches until the outbox is empty; returns the number of events processed"""
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        processed = process_batch(batch_size)
+        if not processed:
+            break
+        total += processed
+        batches += 1
+    return total
@@ -0,0 +1,60 @@
+"""
+Overdue sweeper.
+
+Moves issued books that are past their expected return date to ``overdue``
+with a single UPDATE and then runs the batched fine accrual in
+``library.fines``, instead of saving every issue row from the
+``admin_issues`` page.
+
+Run it from cron with ``python manage.py sweep_overdue``, or let the
+request hook in ``library.signals`` run it at most once every
+``OVERDUE_SWEEP_INTERVAL`` seconds.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from . import ledger, stats
+from .fines import accrue_fines
+from .models import IssueRequest
+
+logger = logging.getLogger(__name__)
+
+SWEEP_LOCK_KEY = 'library:overdue_sweep'
+
+
+def sweep_overdue(today=None):
+    """
+    Mark every issued book past its due date as overdue and upsert its fine.
+    Returns a dict with the number of issues marked and fines created/updated.
+    """
+    today = today or timezone.now().date()
+    due = IssueRequest.objects.filter(status='issued', expected_return_date__lt=today)
+    with transaction.atomic():
+        student_ids = set(due.select_for_update().values_list('student_id', flat=True))
+        marked = due.update(status='overdue', updated_at=timezone.now())
+        ledger.rebuild(student_ids)
+    stats.adjust(**stats.issue_status_deltas('issued', 'overdue', marked))
+
+    result = accrue_fines(today=today)
+    result['marked_overdue'] = marked
+    return result
+
+
+def run_scheduled_sweep():
+    """Run the sweep if no worker has done so within OVERDUE_SWEEP_INTERVAL seconds"""
+    interval = getattr(settings, 'OVERDUE_SWEEP_INTERVAL', 0)
+    if not interval:
+        return None
+    # cache.add only succeeds for the first worker in each interval
+    if not cache.add(SWEEP_LOCK_KEY, timezone.now().isoformat(), timeout=interval):
+        return None
+    try:
+        return sweep_overdue()
+    except Exception:
+        cache.delete(SWEEP_LOCK_KEY)
+        logger.exception('Scheduled overdue sweep failed')
+        return None
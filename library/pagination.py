@@ -0,0 +1,199 @@
+"""
+Keyset (cursor) pagination shared by the list views.
+
+Instead of materializing a whole queryset, each page is fetched with a
+``WHERE (ordering columns) > (last row seen)`` filter and a ``LIMIT``, so the
+cost of a page does not grow with the size of the table or the page number.
+The cursor is an opaque, URL-safe token holding the ordering values of the
+last row on the previous page. A cursor that cannot be decoded, or whose
+values do not fit the ordering fields, is ignored and the first page is
+returned.
+"""
+import base64
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import JsonResponse
+
+from .json_encoder import CustomJSONEncoder
+
+CURSOR_PARAM = 'cursor'
+DEFAULT_PAGE_SIZE = 24
+
+# Stable orderings used by the list views; the trailing id breaks ties
+BOOK_ORDERINGS = {
+    'title': ('title', 'id'),
+    '-title': ('-title', '-id'),
+    'author': ('author__name', 'id'),
+    '-author': ('-author__name', '-id'),
+}
+AUTHOR_ORDERING = ('name', 'id')
+STUDENT_ORDERING = ('student_id', 'id')
+RECENT_ORDERING = ('-created_at', '-id')
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keeps datetimes at full precision; DjangoJSONEncoder cuts them to milliseconds"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    """Pack ordering values into an opaque cursor string"""
+    raw = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Unpack a cursor string; returns None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def _ordering_field(model, path):
+    field = None
+    for part in path.split('__'):
+        field = model._meta.get_field(part)
+        model = field.related_model
+    return field
+
+
+def clean_cursor(model, ordering, values):
+    """Cursor values converted to the types of the ordering fields; None if they do not fit"""
+    if values is None or len(values) != len(ordering):
+        return None
+    try:
+        cleaned = [
+            _ordering_field(model, field.lstrip('-')).to_python(value)
+            for field, value in zip(ordering, values)
+        ]
+    except (FieldDoesNotExist, ValidationError, TypeError, ValueError):
+        return None
+    return None if any(value is None for value in cleaned) else cleaned
+
+
+def resolve(obj, path):
+    """Follow a ``field__subfield`` or ``attr.subattr`` path on an object"""
+    for part in path.replace('.', '__').split('__'):
+        if obj is None:
+            return None
+        obj = getattr(obj, part)
+    return obj
+
+
+def keyset_filter(ordering, values):
+    """Build the Q object selecting rows strictly after the cursor values"""
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+class KeysetPage:
+    """One page of results plus the cursor for the next page"""
+
+    def __init__(self, items, next_cursor, request=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.request = request
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return self.request is None or not self.request.GET.get(CURSOR_PARAM)
+
+    @property
+    def next_query(self):
+        """Current query string with the cursor moved to the next page"""
+        if not self.has_next or self.request is None:
+            return ''
+        params = self.request.GET.copy()
+        params[CURSOR_PARAM] = self.next_cursor
+        params.pop('format', None)
+        return params.urlencode()
+
+    @property
+    def first_query(self):
+        """Current query string without a cursor"""
+        if self.request is None:
+            return ''
+        params = self.request.GET.copy()
+        params.pop(CURSOR_PARAM, None)
+        params.pop('format', None)
+        return params.urlencode()
+
+    def as_json(self, fields, **extra):
+        """JSON response for infinite scroll, with the given attribute paths per row"""
+        results = [{field.replace('.', '_'): resolve(item, field) for field in fields} for item in self.items]
+        return JsonResponse(
+            {'results': results, 'next_cursor': self.next_cursor, 'has_next': self.has_next, **extra},
+            encoder=CustomJSONEncoder,
+        )
+
+
+def paginate_keyset(request, queryset, ordering, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return a KeysetPage of ``queryset`` ordered by ``ordering``.
+    Only ``page_size + 1`` rows are fetched from the database.
+    """
+    queryset = queryset.order_by(*ordering)
+    values = clean_cursor(queryset.model, ordering, decode_cursor(request.GET.get(CURSOR_PARAM)))
+    if values is not None:
+        queryset = queryset.filter(keyset_filter(ordering, values))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([resolve(rows[-1], field.lstrip('-')) for field in ordering])
+    return KeysetPage(rows, next_cursor, request)
+
+
+def paginate_ranked(request, queryset, ranked_ids, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Paginate search results kept in relevance order.
+    The cursor is the position in the ranked id list, so only the ids of the
+    requested page are loaded from the database.
+    """
+    values = decode_cursor(request.GET.get(CURSOR_PARAM))
+    start = values[0] if values and isinstance(values[0], int) and values[0] > 0 else 0
+    page_ids = ranked_ids[start:start + page_size]
+    rows = queryset.in_bulk(page_ids)
+    items = [rows[book_id] for book_id in page_ids if book_id in rows]
+    next_cursor = None
+    if start + page_size < len(ranked_ids):
+        next_cursor = encode_cursor([start + page_size])
+    return KeysetPage(items, next_cursor, request)
+
+
+def wants_json(request):
+    """Infinite-scroll clients ask for ``?format=json``"""
+    return request.GET.get('format') == 'json'
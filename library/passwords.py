@@ -0,0 +1,121 @@
+"""
+Bounded password hashing.
+
+PBKDF2 is deliberately slow, and a burst of logins used to run it inline on
+every web worker at once. All password checks now go through one small
+thread pool per process (``PASSWORD_HASH_WORKERS`` threads; ``hashlib``
+releases the GIL while it hashes). At most ``PASSWORD_HASH_MAX_PENDING``
+checks may wait for a thread. Past that a login fails fast with
+``HashingBusy`` instead of queueing behind the burst.
+
+``averify`` lets the async login views wait for the pool without holding a
+thread, so under ASGI the rest of the site keeps serving during a login
+burst. A successful check returns a fresh hash when the stored one uses
+outdated hasher parameters, so the caller can save it (rehash on login).
+``metrics()`` reports the queue depth for the admin metrics endpoint.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(Exception):
+    """Too many password checks are already waiting for the hashing pool"""
+
+
+class HashingPool:
+    """Thread pool for password hashing with admission control and counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._waiting = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @property
+    def workers(self):
+        return getattr(settings, 'PASSWORD_HASH_WORKERS', 2)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'PASSWORD_HASH_MAX_PENDING', 32)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        return self._executor
+
+    def submit(self, function, *args):
+        """Queue ``function(*args)``; raises HashingBusy when the queue is full"""
+        with self._lock:
+            if self._waiting >= self.max_pending:
+                self._rejected += 1
+                logger.warning('Password hashing queue full (%d waiting), rejecting a login', self._waiting)
+                raise HashingBusy()
+            self._waiting += 1
+            executor = self._get_executor()
+        return executor.submit(self._run, time.monotonic(), function, args)
+
+    def _run(self, queued_at, function, args):
+        waited = time.monotonic() - queued_at
+        with self._lock:
+            self._waiting -= 1
+            self._running += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        try:
+            return function(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'waiting': self._waiting,
+                'running': self._running,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'average_wait_ms': round(self._total_wait * 1000 / self._completed, 1) if self._completed else 0,
+                'max_wait_ms': round(self._max_wait * 1000, 1),
+            }
+
+
+pool = HashingPool()
+
+
+def _verify(raw_password, encoded):
+    rehashed = []
+    valid = check_password(raw_password, encoded, setter=lambda password: rehashed.append(make_password(password)))
+    return valid, (rehashed[0] if rehashed else None)
+
+
+def verify(raw_password, encoded):
+    """
+    Check a password on the hashing pool, blocking the calling thread.
+    Returns (valid, new_hash); new_hash is set when the stored hash is outdated.
+    """
+    return pool.submit(_verify, raw_password, encoded).result()
+
+
+async def averify(raw_password, encoded):
+    """``verify`` for async views: waits for the pool without holding a thread"""
+    return await asyncio.wrap_future(pool.submit(_verify, raw_password, encoded))
+
+
+def metrics():
+    return pool.metrics()
@@ -0,0 +1,108 @@
+"""
+EXPLAIN checks for the hot queries of the circulation and fine pages.
+
+Each entry in ``HOT_QUERIES`` builds the queryset a view or job actually
+runs. ``explain_all`` asks the database for its plan and flags every table
+it reads with a full scan, so a missing or unused index shows up before the
+tables are large enough for users to notice. Plans depend on table
+statistics; run it against a database with realistic data (for example one
+seeded with ``benchmark_queries --keepdb``).
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Fine, IssueRequest, Student
+from .reminders import due_soon
+
+
+def _sample_ids():
+    """Ids of an existing student and book so the plans use real values"""
+    issue = IssueRequest.objects.order_by().values('student_id', 'book_id').first()
+    if issue is None:
+        return 0, 0
+    return issue['student_id'], issue['book_id']
+
+
+def hot_queries():
+    """(name, queryset) pairs for the queries on the hot paths"""
+    student_id, book_id = _sample_ids()
+    today = timezone.now().date()
+    return [
+        ('student active loans', IssueRequest.objects.filter(
+            student_id=student_id, status__in=['issued', 'overdue'],
+        )),
+        ('duplicate request check', IssueRequest.objects.filter(
+            book_id=book_id, student_id=student_id, status__in=['requested', 'issued', 'overdue'],
+        )),
+        ('student issue history', IssueRequest.objects.filter(
+            student_id=student_id,
+        ).order_by('-request_date')[:25]),
+        ('overdue sweep', IssueRequest.objects.filter(
+            status='issued', expected_return_date__lt=today,
+        ).values('id')),
+        ('due reminders', due_soon(today, settings.DUE_REMINDER_DAYS).values_list('student_id', 'id', 'expected_return_date')),
+        ('fine accrual chunk', IssueRequest.objects.filter(
+            status__in=['issued', 'overdue'], expected_return_date__lt=today,
+        ).order_by('id').values_list('id', 'student_id', 'expected_return_date')[:1000]),
+        ('pending requests page', IssueRequest.objects.filter(
+            status='requested',
+        ).order_by('-created_at', '-id')[:25]),
+        ('student unpaid fines', Fine.objects.filter(
+            student_id=student_id, is_paid=False,
+        ).values('amount')),
+        ('fines page', Fine.objects.order_by('-created_at', '-id')[:25]),
+        ('signup availability', Student.objects.filter(
+            Q(username_folded='student') | Q(student_id='S0') | Q(email='student@example.com'),
+        ).order_by().values_list('username_folded', 'student_id', 'email')),
+        ('active students', Student.objects.filter(status='active').values('id')),
+    ]
+
+
+def _explain(sql, params):
+    """Rows of the database's plan for ``sql`` as a list of dicts"""
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        columns = [column[0].lower() for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    """Tables read with a full table scan in an EXPLAIN plan"""
+    vendor = connection.vendor
+    scans = []
+    for row in plan:
+        if vendor == 'mysql':
+            if row.get('type') == 'ALL':
+                scans.append(row.get('table'))
+        elif vendor == 'sqlite':
+            detail = row.get('detail', '')
+            # "SCAN t USING INDEX i" walks an index in order; only bare scans read every row
+            if detail.startswith('SCAN ') and ' USING ' not in detail:
+                scans.append(detail.split()[1])
+        elif vendor == 'postgresql':
+            line = next(iter(row.values()), '')
+            if 'Seq Scan on ' in line:
+                scans.append(line.split('Seq Scan on ')[1].split()[0])
+    return scans
+
+
+def explain_all():
+    """Plan of every hot query; returns a list of dicts with name, sql, plan and scans"""
+    results = []
+    for name, queryset in hot_queries():
+        sql, params = queryset.query.sql_with_params()
+        plan = _explain(sql, params)
+        results.append({
+            'name': name,
+            'sql': sql,
+            'plan': plan,
+            'scans': full_scans(plan),
+        })
+    return results
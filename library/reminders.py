@@ -0,0 +1,65 @@
+"""
+Due-date reminders.
+
+``send_due_reminders`` finds every issued book due within the next
+``DUE_REMINDER_DAYS`` days with one range query on the
+``(status, expected_return_date)`` index, groups the loans per student and
+queues one ``due_reminder`` outbox event per student, a batch at a time.
+The ``process_notifications`` worker turns them into notifications.
+
+Each reminded issue gets ``reminder_sent_on`` set in the same transaction
+as its event, so a rerun on the same day skips it and the job is safe to
+run from cron as often as needed.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import IssueRequest
+from .notifications import enqueue_many
+
+BATCH_SIZE = 500  # students per transaction
+
+
+def due_soon(today, days):
+    """Issued books due between ``today`` and ``today + days`` not yet reminded today"""
+    return IssueRequest.objects.filter(
+        Q(reminder_sent_on__isnull=True) | Q(reminder_sent_on__lt=today),
+        status='issued',
+        expected_return_date__range=(today, today + timedelta(days=days)),
+    )
+
+
+def send_due_reminders(today=None, days=None, batch_size=BATCH_SIZE):
+    """
+    Queue a reminder for every student with books due soon.
+    Returns a dict with the number of students and issues reminded.
+    """
+    today = today or timezone.now().date()
+    days = settings.DUE_REMINDER_DAYS if days is None else days
+    rows = (
+        due_soon(today, days)
+        .order_by('student_id', 'expected_return_date', 'id')
+        .values_list('student_id', 'id', 'book__title', 'expected_return_date')
+    )
+    per_student = [
+        (student_id, list(loans))
+        for student_id, loans in groupby(rows.iterator(chunk_size=2000), key=lambda row: row[0])
+    ]
+
+    issues = 0
+    for start in range(0, len(per_student), batch_size):
+        batch = per_student[start:start + batch_size]
+        issue_ids = [issue_id for _, loans in batch for _, issue_id, _, _ in loans]
+        with transaction.atomic():
+            enqueue_many('due_reminder', [
+                (student_id, {'books': [[title, due_date.isoformat()] for _, _, title, due_date in loans]})
+                for student_id, loans in batch
+            ])
+            IssueRequest.objects.filter(id__in=issue_ids).update(reminder_sent_on=today)
+        issues += len(issue_ids)
+    return {'students': len(per_student), 'issues': issues}
@@ -0,0 +1,215 @@
+"""
+In-process catalog search index.
+
+Books are tokenized once (title, author name, category and ISBN) into an
+inverted index that lives in each worker. Queries are answered from memory
+with prefix matching and relevance ranking, so the catalog pages no longer
+run OR-ed ``icontains`` scans over ``library_book`` and ``library_author``.
+
+The index is kept in sync by the ``Book``/``Author`` signal handlers in
+``library.signals``. Other workers notice changes through a catalog version
+number stored in the cache, and every index is rebuilt after
+``SEARCH_INDEX_MAX_AGE`` seconds as a safety net.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .cache import get_catalog_version
+
+# Relevance weight of each indexed field
+FIELD_WEIGHTS = {
+    'title': 3,
+    'author': 2,
+    'category': 1,
+    'isbn': 1,
+}
+
+TOKEN_RE = re.compile(r'[0-9a-z]+')
+ISBN_RE = re.compile(r'^[0-9]{9}[0-9x]([0-9]{3})?$')
+
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric tokens"""
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+def normalize_isbn(value):
+    """Strip spaces and hyphens from an ISBN"""
+    return re.sub(r'[\s-]', '', value or '').lower()
+
+
+class CatalogIndex:
+    """Inverted index of the book catalog"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}     # token -> {book_id: weight}
+        self._documents = {}    # book_id -> (sort_key, tokens, isbn)
+        self._isbns = {}        # normalized isbn -> book_id
+        self._vocabulary = []   # sorted tokens for prefix lookups
+        self._vocabulary_dirty = False
+        self._version = None
+        self._built_at = 0
+
+    # ---------- building ----------
+
+    def rebuild(self):
+        """Load every book from the database into a fresh index"""
+        from .models import Book
+
+        version = get_catalog_version()
+        rows = Book.objects.values_list('id', 'title', 'author__name', 'category', 'isbn')
+        with self._lock:
+            self._postings = {}
+            self._documents = {}
+            self._isbns = {}
+            for row in rows.iterator():
+                self._add(*row)
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+            self._version = version
+            self._built_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """Rebuild the index if another worker changed the catalog or it is too old"""
+        max_age = getattr(settings, 'SEARCH_INDEX_MAX_AGE', 300)
+        if (
+            self._version is None
+            or self._version != get_catalog_version()
+            or time.monotonic() - self._built_at > max_age
+        ):
+            self.rebuild()
+
+    def _add(self, book_id, title, author_name, category, isbn):
+        fields = {
+            'title': tokenize(title),
+            'author': tokenize(author_name),
+            'category': tokenize(category),
+            'isbn': tokenize(isbn),
+        }
+        tokens = set()
+        for field, field_tokens in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for token in field_tokens:
+                postings = self._postings.setdefault(token, {})
+                if weight > postings.get(book_id, 0):
+                    postings[book_id] = weight
+                tokens.add(token)
+        isbn = normalize_isbn(isbn)
+        self._documents[book_id] = ((title or '').lower(), tokens, isbn)
+        if isbn:
+            self._isbns[isbn] = book_id
+
+    def _remove(self, book_id):
+        document = self._documents.pop(book_id, None)
+        if document is None:
+            return
+        for token in document[1]:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(book_id, None)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+        if self._isbns.get(document[2]) == book_id:
+            del self._isbns[document[2]]
+
+    # ---------- incremental updates ----------
+
+    def update_books(self, rows, version=None):
+        """Re-index books given as (id, title, author name, category, isbn) rows"""
+        with self._lock:
+            if self._version is None:
+                return
+            for row in rows:
+                self._remove(row[0])
+                self._add(*row)
+            self._vocabulary_dirty = True
+            self._sync_version(version)
+
+    def remove_book(self, book_id, version=None):
+        """Drop a deleted book from the index"""
+        with self._lock:
+            if self._version is None:
+                return
+            self._remove(book_id)
+            self._sync_version(version)
+
+    def _sync_version(self, version):
+        # Only adopt the new version if no other worker changed the catalog
+        # in between; otherwise leave it stale so the next query rebuilds.
+        if version is not None and version == self._version + 1:
+            self._version = version
+
+    # ---------- querying ----------
+
+    def _expand(self, prefix):
+        """Indexed tokens starting with the given prefix"""
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        vocabulary = self._vocabulary
+        position = bisect_left(vocabulary, prefix)
+        while position < len(vocabulary) and vocabulary[position].startswith(prefix):
+            yield vocabulary[position]
+            position += 1
+
+    def search(self, query):
+        """Return matching book ids, best match first"""
+        self.ensure_fresh()
+        with self._lock:
+            isbn = normalize_isbn(query)
+            if ISBN_RE.match(isbn) and isbn in self._isbns:
+                return [self._isbns[isbn]]
+
+            scores = None
+            for term in dict.fromkeys(tokenize(query)):
+                matches = {}
+                for token in self._expand(term):
+                    exact = token == term
+                    for book_id, weight in self._postings[token].items():
+                        score = weight * 2 if exact else weight
+                        if score > matches.get(book_id, 0):
+                            matches[book_id] = score
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {
+                        book_id: score + matches[book_id]
+                        for book_id, score in scores.items()
+                        if book_id in matches
+                    }
+                if not scores:
+                    return []
+
+            if not scores:
+                return []
+            return sorted(
+                scores,
+                key=lambda book_id: (-scores[book_id], self._documents[book_id][0], book_id),
+            )
+
+
+catalog_index = CatalogIndex()
+
+
+def search_book_ids(query):
+    """Ranked ids of the books matching a search query"""
+    return catalog_index.search(query)
+
+
+def search_books(books, query):
+    """
+    Restrict a Book queryset to the search results.
+    Returns the filtered queryset and the ranked list of matching ids.
+    """
+    ranked_ids = search_book_ids(query)
+    return books.filter(id__in=ranked_ids), ranked_ids
+
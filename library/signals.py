@@ -0,0 +1,244 @@
+"""
+Signal handlers that keep derived data in sync with the models.
+"""
+from decimal import Decimal
+
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import activity, availability, ledger, stats
+from .feed import notify_changed_on_commit
+from .identity import forget_identity
+from .models import Admin, Author, Book, Fine, IssueRequest, Notification, Student
+from .overdue import run_scheduled_sweep
+from .cache import bump_catalog_version
+from .search import catalog_index
+from .student_index import INDEXED_FIELDS, bump_directory_version, student_index, student_row
+
+
+def _book_row(book):
+    return (book.pk, book.title, book.author.name, book.category, book.isbn)
+
+
+@receiver(post_save, sender=Book)
+def index_saved_book(sender, instance, **kwargs):
+    """Re-index a book once its transaction commits"""
+    row = _book_row(instance)
+    transaction.on_commit(
+        lambda: catalog_index.update_books([row], version=bump_catalog_version())
+    )
+
+
+@receiver(post_delete, sender=Book)
+def unindex_deleted_book(sender, instance, **kwargs):
+    """Drop a deleted book from the search index"""
+    book_id = instance.pk
+    transaction.on_commit(
+        lambda: catalog_index.remove_book(book_id, version=bump_catalog_version())
+    )
+
+
+@receiver(post_save, sender=Author)
+def reindex_author_books(sender, instance, created, **kwargs):
+    """Author names are indexed with every book, so refresh them on rename"""
+    if created:
+        transaction.on_commit(bump_catalog_version)
+        return
+    rows = list(
+        Book.objects.filter(author=instance).values_list(
+            'id', 'title', 'author__name', 'category', 'isbn'
+        )
+    )
+    transaction.on_commit(
+        lambda: catalog_index.update_books(rows, version=bump_catalog_version())
+    )
+
+
+@receiver(post_delete, sender=Author)
+def forget_deleted_author(sender, instance, **kwargs):
+    """Author counts on the homepage are tied to the catalog version"""
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_init, sender=Student)
+def remember_indexed_row(sender, instance, **kwargs):
+    instance._indexed_row = student_row(instance)
+    instance._identifiers = (instance.username_folded, instance.student_id)
+
+
+@receiver(post_save, sender=Student)
+def record_taken_identifiers(sender, instance, created, **kwargs):
+    """Keep the username/student ID availability snapshots current"""
+    identifiers = (instance.username_folded, instance.student_id)
+    if created:
+        username, student_id = instance.username, instance.student_id
+        transaction.on_commit(lambda: availability.student_created(username, student_id))
+    elif identifiers != getattr(instance, '_identifiers', identifiers):
+        transaction.on_commit(availability.identifiers_changed)
+    instance._identifiers = identifiers
+
+
+@receiver(post_delete, sender=Student)
+def release_identifiers(sender, instance, **kwargs):
+    """A deleted student frees its username and student ID"""
+    transaction.on_commit(availability.identifiers_changed)
+
+
+@receiver(post_save, sender=Student)
+def index_saved_student(sender, instance, created, update_fields=None, **kwargs):
+    """Re-index a student whose searchable fields changed, once the transaction commits"""
+    if update_fields is not None and not set(update_fields) & set(INDEXED_FIELDS):
+        return
+    row = student_row(instance)
+    if not created and row == getattr(instance, '_indexed_row', None):
+        return
+    instance._indexed_row = row
+    transaction.on_commit(
+        lambda: student_index.update_students([row], version=bump_directory_version())
+    )
+
+
+@receiver(post_delete, sender=Student)
+def unindex_deleted_student(sender, instance, **kwargs):
+    """Drop a deleted student from the lookup index"""
+    pk = instance.pk
+    transaction.on_commit(
+        lambda: student_index.remove_student(pk, version=bump_directory_version())
+    )
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def forget_cached_student(sender, instance, **kwargs):
+    """Drop the cached identity so the next request sees the change"""
+    pk = instance.pk
+    transaction.on_commit(lambda: forget_identity('student', pk))
+
+
+@receiver(post_save, sender=Admin)
+@receiver(post_delete, sender=Admin)
+def forget_cached_admin(sender, instance, **kwargs):
+    """Drop the cached identity so the next request sees the change"""
+    pk = instance.pk
+    transaction.on_commit(lambda: forget_identity('admin', pk))
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def refresh_unread_count(sender, instance, **kwargs):
+    """New, read or deleted notifications change the student's unread count"""
+    if instance.student_id:
+        notify_changed_on_commit([instance.student_id])
+
+
+# ---------- statistics counters and student ledgers ----------
+
+DEFERRED = object()  # field was not loaded, so the old value is unknown
+
+
+def _unpaid_cents(fine):
+    if fine.is_paid:
+        return 0
+    return stats.to_cents(fine.amount)
+
+
+@receiver(post_save, sender=Book)
+def count_saved_book(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: stats.adjust(books=1))
+
+
+@receiver(post_delete, sender=Book)
+def count_deleted_book(sender, instance, **kwargs):
+    transaction.on_commit(lambda: stats.adjust(books=-1))
+
+
+@receiver(post_init, sender=Student)
+@receiver(post_init, sender=IssueRequest)
+def remember_loaded_status(sender, instance, **kwargs):
+    """Keep the status as loaded so a save can tell which counter moved"""
+    instance._loaded_status = instance.__dict__.get('status', DEFERRED)
+
+
+@receiver(post_save, sender=Student)
+def count_saved_student(sender, instance, created, **kwargs):
+    if not created and instance._loaded_status is DEFERRED:
+        transaction.on_commit(stats.invalidate)
+        return
+    old_active = not created and instance._loaded_status == 'active'
+    new_active = instance.status == 'active'
+    instance._loaded_status = instance.status
+    if old_active != new_active:
+        transaction.on_commit(lambda: stats.adjust(active_students=1 if new_active else -1))
+
+
+@receiver(post_delete, sender=Student)
+def count_deleted_student(sender, instance, **kwargs):
+    if instance.status == 'active':
+        transaction.on_commit(lambda: stats.adjust(active_students=-1))
+
+
+@receiver(post_save, sender=IssueRequest)
+def count_saved_issue(sender, instance, created, **kwargs):
+    if not created and instance._loaded_status is DEFERRED:
+        ledger.rebuild([instance.student_id])
+        transaction.on_commit(stats.invalidate)
+        return
+    old_status = None if created else instance._loaded_status
+    deltas = stats.issue_status_deltas(old_status, instance.status)
+    instance._loaded_status = instance.status
+    # The ledger moves inside the same transaction; the shared counters after commit
+    ledger.adjust(instance.student_id, **ledger.issue_status_deltas(old_status, instance.status))
+    if deltas:
+        transaction.on_commit(lambda: stats.adjust(**deltas))
+
+
+@receiver(post_delete, sender=IssueRequest)
+def count_deleted_issue(sender, instance, **kwargs):
+    ledger.adjust(instance.student_id, **ledger.issue_status_deltas(instance.status, None))
+    deltas = stats.issue_status_deltas(instance.status, None)
+    if deltas:
+        transaction.on_commit(lambda: stats.adjust(**deltas))
+
+
+@receiver(post_init, sender=Fine)
+def remember_loaded_fine(sender, instance, **kwargs):
+    if 'amount' in instance.__dict__ and 'is_paid' in instance.__dict__:
+        instance._loaded_unpaid_cents = _unpaid_cents(instance)
+    else:
+        instance._loaded_unpaid_cents = None
+
+
+@receiver(post_save, sender=Fine)
+def count_saved_fine(sender, instance, created, **kwargs):
+    old_cents = 0 if created else instance._loaded_unpaid_cents
+    new_cents = _unpaid_cents(instance)
+    instance._loaded_unpaid_cents = new_cents
+    if old_cents is None:
+        ledger.rebuild([instance.student_id])
+        transaction.on_commit(stats.invalidate)
+    elif new_cents != old_cents:
+        ledger.adjust(instance.student_id, outstanding_fines=Decimal(new_cents - old_cents) / 100)
+        transaction.on_commit(lambda: stats.adjust(unpaid_fines_cents=new_cents - old_cents))
+
+
+@receiver(post_delete, sender=Fine)
+def count_deleted_fine(sender, instance, **kwargs):
+    cents = _unpaid_cents(instance)
+    if cents:
+        ledger.adjust(instance.student_id, outstanding_fines=-Decimal(cents) / 100)
+        transaction.on_commit(lambda: stats.adjust(unpaid_fines_cents=-cents))
+
+
+@receiver(request_finished)
+def sweep_overdue_after_request(sender, **kwargs):
+    """In-process scheduler: run the overdue sweep once per interval after a response"""
+    run_scheduled_sweep()
+
+
+@receiver(request_finished)
+def flush_activity_after_request(sender, **kwargs):
+    """Write buffered login times once the buffer is old or large enough"""
+    activity.maybe_flush()
@@ -0,0 +1,131 @@
+"""
+Library statistics counters.
+
+The dashboard counters live in the cache as one integer key each. They are
+adjusted with atomic ``incr``/``decr`` calls from the model signals in
+``library.signals`` (and by the bulk circulation operations, which bypass
+signals), and read back with a single ``get_many``. A marker key expires
+every ``STATS_RECONCILE_INTERVAL`` seconds; the next read then recomputes
+every counter from the database so any drift is corrected.
+
+The increments only reach every worker through a shared cache (Redis in
+docker-compose). With the default per-process cache each worker counts on
+its own, so settings shorten the reconcile interval to a few seconds and
+the counters are mostly recounted.
+
+Catalog facets (author count, category list) only change with the catalog
+and are cached per catalog version instead.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+
+from .cache import get_versioned
+from .models import Author, Book, Fine, IssueRequest, Student
+
+KEY_PREFIX = 'library:stats:'
+FRESH_KEY = KEY_PREFIX + 'fresh'
+
+COUNTERS = (
+    'books',
+    'active_students',
+    'issued',
+    'requested',
+    'overdue',
+    'unpaid_fines_cents',
+)
+
+# IssueRequest statuses that have a counter
+ISSUE_COUNTERS = {'issued', 'requested', 'overdue'}
+
+
+def _key(name):
+    return KEY_PREFIX + name
+
+
+def to_cents(amount):
+    return int((Decimal(amount or 0) * 100).to_integral_value())
+
+
+def compute_stats():
+    """Recompute every counter from the database"""
+    issues = IssueRequest.objects.aggregate(
+        issued=Count('id', filter=Q(status='issued')),
+        requested=Count('id', filter=Q(status='requested')),
+        overdue=Count('id', filter=Q(status='overdue')),
+    )
+    unpaid = Fine.objects.filter(is_paid=False).aggregate(total=Sum('amount'))['total']
+    return {
+        'books': Book.objects.count(),
+        'active_students': Student.objects.filter(status='active').count(),
+        'issued': issues['issued'],
+        'requested': issues['requested'],
+        'overdue': issues['overdue'],
+        'unpaid_fines_cents': to_cents(unpaid),
+    }
+
+
+def reconcile():
+    """Overwrite the cached counters with fresh values from the database"""
+    values = compute_stats()
+    cache.set_many({_key(name): value for name, value in values.items()}, timeout=None)
+    cache.set(FRESH_KEY, True, timeout=getattr(settings, 'STATS_RECONCILE_INTERVAL', 600))
+    return values
+
+
+def invalidate():
+    """Force the next read to reconcile (after bulk writes with unknown deltas)"""
+    cache.delete(FRESH_KEY)
+
+
+def adjust(**deltas):
+    """Apply counter deltas, e.g. adjust(issued=-1, overdue=1)"""
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        try:
+            cache.incr(_key(name), delta)
+        except ValueError:
+            # Counter not cached yet; the next read reconciles
+            invalidate()
+
+
+def get_stats():
+    """All counters from a single cache read, reconciling when stale"""
+    keys = [_key(name) for name in COUNTERS] + [FRESH_KEY]
+    cached = cache.get_many(keys)
+    if len(cached) < len(keys):
+        values = reconcile()
+    else:
+        values = {name: cached[_key(name)] for name in COUNTERS}
+    values['unpaid_fines'] = (Decimal(values['unpaid_fines_cents']) / 100).quantize(Decimal('0.01'))
+    return values
+
+
+def issue_status_deltas(old_status, new_status, count=1):
+    """Counter deltas for issue requests moving from one status to another"""
+    deltas = {}
+    if old_status in ISSUE_COUNTERS:
+        deltas[old_status] = deltas.get(old_status, 0) - count
+    if new_status in ISSUE_COUNTERS:
+        deltas[new_status] = deltas.get(new_status, 0) + count
+    return deltas
+
+
+def _build_catalog_facets():
+    return {
+        'authors': Author.objects.count(),
+        'categories': list(
+            Book.objects.exclude(category='')
+            .order_by('category')
+            .values_list('category', flat=True)
+            .distinct()
+        ),
+    }
+
+
+def get_catalog_facets():
+    """Author count and category list, cached per catalog version"""
+    return get_versioned('facets', _build_catalog_facets)
@@ -0,0 +1,150 @@
+"""
+Notification stream for ASGI deployments.
+
+``NotificationStreamApp`` wraps the Django ASGI application in
+``library_project/asgi.py`` and serves ``/api/notifications/stream/``
+itself. Each open connection only watches the student's feed version in
+the cache (``library.feed``), never the database, and wakes up when it
+changes:
+
+* default: a ``text/event-stream`` that sends ``{"unread", "version"}`` on
+  every change, with keep-alive comments, closed after
+  ``NOTIFICATION_STREAM_MAX_AGE`` seconds (EventSource reconnects);
+* ``?wait=1&since=<version>``: long-poll, one JSON response as soon as the
+  version differs from ``since`` or after ``NOTIFICATION_LONG_POLL_TIMEOUT``
+  seconds.
+
+Every keep-alive the stream also re-reads the unread count (cached for
+``NOTIFICATION_UNREAD_TTL`` seconds) and sends it if it moved, in case the
+version bump happened in a cache this process cannot see.
+"""
+import asyncio
+import json
+import time
+from http.cookies import SimpleCookie
+from importlib import import_module
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import feed
+from .identity import principal_id
+
+STREAM_PATH = '/api/notifications/stream/'
+KEEPALIVE_SECONDS = 15
+
+
+async def _student_id(scope):
+    """Logged in student id from the session cookie, or None"""
+    cookies = SimpleCookie()
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return None
+    store = import_module(settings.SESSION_ENGINE).SessionStore(morsel.value)
+    session = await sync_to_async(store.load)()
+    return principal_id(session, 'student')
+
+
+# The version lives only in the cache, so reading it needs no database
+# connection and need not queue on the single thread shared with the ORM
+_get_version = sync_to_async(feed.get_version, thread_sensitive=False)
+
+
+async def _state(student_id):
+    version = await _get_version(student_id)
+    unread = await sync_to_async(feed.unread_count)(student_id)
+    return {'unread': unread, 'version': version}
+
+
+async def _send_json(send, status, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'cache-control', b'no-cache')],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+
+
+class NotificationStreamApp:
+    """ASGI middleware serving the notification stream in front of Django"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != STREAM_PATH:
+            return await self.app(scope, receive, send)
+
+        student_id = await _student_id(scope)
+        if not student_id:
+            return await _send_json(send, 401, {'success': False, 'message': 'Please login as a student.'})
+
+        params = parse_qs(scope.get('query_string', b'').decode())
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+        try:
+            if params.get('wait'):
+                await self._long_poll(send, student_id, params.get('since', [''])[0], disconnected)
+            else:
+                await self._event_stream(send, student_id, disconnected)
+        finally:
+            watcher.cancel()
+
+    async def _watch_disconnect(self, receive, disconnected):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    async def _wait_for_change(self, student_id, version, timeout, disconnected):
+        """Poll the cached version until it moves, the timeout passes or the client leaves"""
+        interval = getattr(settings, 'NOTIFICATION_POLL_INTERVAL', 1.0)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not disconnected.is_set():
+            current = await _get_version(student_id)
+            if str(current) != str(version):
+                return True
+            try:
+                await asyncio.wait_for(disconnected.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+        return False
+
+    async def _long_poll(self, send, student_id, since, disconnected):
+        timeout = getattr(settings, 'NOTIFICATION_LONG_POLL_TIMEOUT', 25)
+        if since:
+            await self._wait_for_change(student_id, since, timeout, disconnected)
+        if not disconnected.is_set():
+            await _send_json(send, 200, await _state(student_id))
+
+    async def _event_stream(self, send, student_id, disconnected):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        deadline = time.monotonic() + getattr(settings, 'NOTIFICATION_STREAM_MAX_AGE', 300)
+        state = await _state(student_id)
+        await send({'type': 'http.response.body', 'body': f'data: {json.dumps(state)}\n\n'.encode(), 'more_body': True})
+
+        while time.monotonic() < deadline and not disconnected.is_set():
+            changed = await self._wait_for_change(student_id, state['version'], KEEPALIVE_SECONDS, disconnected)
+            if disconnected.is_set():
+                return
+            current = await _state(student_id)
+            if changed or current['unread'] != state['unread']:
+                state = current
+                chunk = f'data: {json.dumps(state)}\n\n'
+            else:
+                chunk = ': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
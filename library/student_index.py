@@ -0,0 +1,284 @@
+"""
+In-process student lookup index for the admin typeahead.
+
+Every student is tokenized once (student ID, username, first and last name,
+email and phone) into an inverted index that lives in each worker, the same
+way ``library.search`` indexes the catalog. Names and emails match by word
+prefix; student IDs and phone numbers also match anywhere inside the value
+(every suffix of at least ``MIN_INFIX`` characters is indexed), like the
+``icontains`` lookups they replace. Answers for a normalized query are
+cached until the index changes.
+
+The index is kept in sync by the ``Student`` signal handlers in
+``library.signals``. Other workers notice changes through a directory
+version number stored in the cache, and every index is rebuilt after
+``SEARCH_INDEX_MAX_AGE`` seconds as a safety net.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .search import tokenize
+
+DIRECTORY_VERSION_KEY = 'library:student_directory_version'
+
+# Fields copied into the index, in row order after the primary key
+INDEXED_FIELDS = ('student_id', 'username', 'first_name', 'last_name', 'email', 'phone', 'department')
+
+# Relevance weight of a word-prefix match in each field
+FIELD_WEIGHTS = {
+    'student_id': 4,
+    'username': 3,
+    'name': 2,
+    'email': 2,
+    'phone': 1,
+}
+INFIX_WEIGHT = 1  # match inside a student ID or phone number
+MIN_INFIX = 3  # shortest indexed infix
+
+MAX_RESULTS = 50
+CACHED_QUERIES = 512
+CANDIDATE_SCAN = 5000  # below this many candidates, later terms are checked per student
+
+DIGITS_RE = re.compile(r'\D')
+
+
+def get_directory_version():
+    """Current student directory version shared through the cache"""
+    version = cache.get(DIRECTORY_VERSION_KEY)
+    if version is None:
+        cache.add(DIRECTORY_VERSION_KEY, 1, timeout=None)
+        version = cache.get(DIRECTORY_VERSION_KEY, 1)
+    return version
+
+
+def bump_directory_version():
+    """Mark the student directory as changed for every worker"""
+    try:
+        return cache.incr(DIRECTORY_VERSION_KEY)
+    except ValueError:
+        cache.add(DIRECTORY_VERSION_KEY, 1, timeout=None)
+        return cache.incr(DIRECTORY_VERSION_KEY)
+
+
+def student_row(student):
+    """(pk, *INDEXED_FIELDS) of a Student instance"""
+    return (student.pk,) + tuple(getattr(student, field) for field in INDEXED_FIELDS)
+
+
+def normalize_query(query):
+    return ' '.join(tokenize(query))
+
+
+class StudentIndex:
+    """Inverted index of the students, for prefix and infix lookups"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}     # token -> {student pk: weight}
+        self._documents = {}    # student pk -> (sort_key, tokens, result)
+        self._vocabulary = []   # sorted tokens for prefix lookups
+        self._vocabulary_dirty = False
+        self._results = OrderedDict()   # normalized query -> results
+        self._version = None
+        self._built_at = 0
+
+    # ---------- building ----------
+
+    def rebuild(self):
+        """Load every student from the database into a fresh index"""
+        from .models import Student
+
+        version = get_directory_version()
+        rows = Student.objects.values_list('id', *INDEXED_FIELDS)
+        with self._lock:
+            self._postings = {}
+            self._documents = {}
+            for row in rows.iterator(chunk_size=5000):
+                self._add(*row)
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+            self._results.clear()
+            self._version = version
+            self._built_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """Rebuild the index if another worker changed a student or it is too old"""
+        max_age = getattr(settings, 'SEARCH_INDEX_MAX_AGE', 300)
+        if (
+            self._version is None
+            or self._version != get_directory_version()
+            or time.monotonic() - self._built_at > max_age
+        ):
+            self.rebuild()
+
+    def _add(self, pk, student_id, username, first_name, last_name, email, phone, department):
+        fields = {
+            'student_id': tokenize(student_id),
+            'username': tokenize(username),
+            'name': tokenize(first_name) + tokenize(last_name),
+            'email': tokenize(email),
+        }
+        identifiers = []
+        if fields['student_id']:
+            # '2021-1-60-001' is also found as '20211'
+            identifiers.append(''.join(fields['student_id']))
+        phone_digits = DIGITS_RE.sub('', phone or '')
+        if phone_digits:
+            identifiers.append(phone_digits)
+        fields['student_id'] = fields['student_id'] + identifiers[:1]
+        fields['phone'] = [phone_digits] if phone_digits else []
+
+        weights = {}
+        for identifier in identifiers:
+            for start in range(1, len(identifier) - MIN_INFIX + 1):
+                weights[identifier[start:]] = INFIX_WEIGHT
+        for field, field_tokens in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for token in field_tokens:
+                if weight > weights.get(token, 0):
+                    weights[token] = weight
+
+        postings = self._postings
+        for token, weight in weights.items():
+            token_postings = postings.get(token)
+            if token_postings is None:
+                postings[token] = {pk: weight}
+            else:
+                token_postings[pk] = weight
+
+        full_name = f'{first_name} {last_name}'.strip()
+        result = {
+            'id': pk,
+            'student_id': student_id or '',
+            'full_name': full_name,
+            'email': email or '',
+            'department': department or '',
+            'phone': phone or '',
+        }
+        self._documents[pk] = ((first_name or '').lower(), tuple(weights), result)
+
+    def _remove(self, pk):
+        document = self._documents.pop(pk, None)
+        if document is None:
+            return
+        for token in document[1]:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(pk, None)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+
+    # ---------- incremental updates ----------
+
+    def update_students(self, rows, version=None):
+        """Re-index students given as (pk, *INDEXED_FIELDS) rows"""
+        with self._lock:
+            if self._version is None:
+                return
+            for row in rows:
+                self._remove(row[0])
+                self._add(*row)
+            self._vocabulary_dirty = True
+            self._results.clear()
+            self._sync_version(version)
+
+    def remove_student(self, pk, version=None):
+        """Drop a deleted student from the index"""
+        with self._lock:
+            if self._version is None:
+                return
+            self._remove(pk)
+            self._results.clear()
+            self._sync_version(version)
+
+    def _sync_version(self, version):
+        # Same rule as the catalog index: only follow our own change
+        if version is not None and version == self._version + 1:
+            self._version = version
+
+    # ---------- querying ----------
+
+    def _expand(self, prefix):
+        """Indexed tokens starting with the given prefix"""
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        vocabulary = self._vocabulary
+        position = bisect_left(vocabulary, prefix)
+        while position < len(vocabulary) and vocabulary[position].startswith(prefix):
+            yield vocabulary[position]
+            position += 1
+
+    def _term_matches(self, term, candidates=None):
+        """{pk: score} for one query term, optionally only among ``candidates``"""
+        matches = {}
+        if candidates is not None and len(candidates) <= CANDIDATE_SCAN:
+            # Few candidates left: check their own tokens instead of the vocabulary
+            for pk in candidates:
+                for token in self._documents[pk][1]:
+                    if token.startswith(term):
+                        weight = self._postings[token][pk]
+                        score = weight * 2 if token == term else weight
+                        if score > matches.get(pk, 0):
+                            matches[pk] = score
+            return matches
+        for token in self._expand(term):
+            exact = token == term
+            for pk, weight in self._postings[token].items():
+                score = weight * 2 if exact else weight
+                if score > matches.get(pk, 0):
+                    matches[pk] = score
+        return matches
+
+    def _match(self, terms):
+        scores = None
+        # Longest terms first: they match the fewest students
+        for term in sorted(terms, key=len, reverse=True):
+            matches = self._term_matches(term, scores)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {pk: score + matches[pk] for pk, score in scores.items() if pk in matches}
+            if not scores:
+                return []
+        ranked = sorted(scores, key=lambda pk: (-scores[pk], self._documents[pk][0], pk))
+        return [self._documents[pk][2] for pk in ranked[:MAX_RESULTS]]
+
+    def search(self, query):
+        """Up to MAX_RESULTS student summaries matching ``query``, best match first"""
+        normalized = normalize_query(query)
+        if not normalized:
+            return []
+        self.ensure_fresh()
+        with self._lock:
+            results = self._results.get(normalized)
+            if results is None:
+                terms = list(dict.fromkeys(normalized.split()))
+                results = []
+                if len(terms) > 1:
+                    # A typed student ID or phone number split on its dashes
+                    results = self._match([''.join(terms)])
+                if not results:
+                    results = self._match(terms)
+                self._results[normalized] = results
+                if len(self._results) > CACHED_QUERIES:
+                    self._results.popitem(last=False)
+            else:
+                self._results.move_to_end(normalized)
+            return results
+
+
+student_index = StudentIndex()
+
+
+def search_students(query):
+    """Ranked student summaries for the admin typeahead"""
+    return student_index.search(query)
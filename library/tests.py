@@ -0,0 +1,266 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core import mail
+from django.conf import settings
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from . import admission, holds, inventory, overdue, stats
+from . import notifications as outbox
+from .identity import set_principal
+from .models import Admin, Author, Book, BookHold, Fine, IssueRequest, Notification, NotificationOutbox, Student
+from .pagination import RECENT_ORDERING, encode_cursor, paginate_keyset
+
+
+class KeysetPaginationTests(TestCase):
+    def test_rows_within_the_same_millisecond_are_not_skipped(self):
+        student = Student.objects.create(
+            student_id='S1', username='s1', first_name='A', last_name='B', email='s1@example.com',
+        )
+        notifications = Notification.objects.bulk_create([
+            Notification(student=student, title=f't{n}', message='m') for n in range(6)
+        ])
+        start = timezone.now().replace(microsecond=0)
+        for n, notification in enumerate(notifications):
+            Notification.objects.filter(pk=notification.pk).update(created_at=start + timedelta(microseconds=100 * n))
+
+        seen, cursor = [], None
+        while True:
+            request = RequestFactory().get('/', {'cursor': cursor} if cursor else {})
+            page = paginate_keyset(request, Notification.objects.all(), RECENT_ORDERING, page_size=2)
+            seen += [notification.title for notification in page.items]
+            cursor = page.next_cursor
+            if not cursor:
+                break
+
+        self.assertEqual(seen, ['t5', 't4', 't3', 't2', 't1', 't0'])
+
+    def test_cursors_that_do_not_fit_the_ordering_return_the_first_page(self):
+        student = Student.objects.create(
+            student_id='S1', username='s1', first_name='A', last_name='B', email='s1@example.com',
+        )
+        Notification.objects.bulk_create([Notification(student=student, title=f't{n}', message='m') for n in range(3)])
+        first = [notification.pk for notification in Notification.objects.order_by(*RECENT_ORDERING)[:2]]
+
+        for values in (['abc', 1], [{'x': 1}, 1], ['2026-01-01T00:00:00', 'zz'], [1], ['2026-01-01T00:00:00', 1, 2]):
+            request = RequestFactory().get('/', {'cursor': encode_cursor(values)})
+            page = paginate_keyset(request, Notification.objects.all(), RECENT_ORDERING, page_size=2)
+            self.assertEqual([notification.pk for notification in page.items], first, values)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class NotificationDeliveryTests(TestCase):
+    def test_failed_delivery_is_retried_without_duplicating_the_notification(self):
+        student = Student.objects.create(
+            student_id='S1', username='s1', first_name='A', last_name='B', email='s1@example.com',
+        )
+        event = outbox.enqueue('return_processed', student.id, book_title='Dune')
+
+        with mock.patch.object(outbox.EmailChannel, 'deliver', side_effect=OSError('SMTP down')), \
+                self.assertLogs('library.notifications', 'ERROR'):
+            self.assertEqual(outbox.process_batch(), 1)
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ('pending', 1))
+        self.assertEqual(outbox.process_batch(), 0)  # backing off
+
+        NotificationOutbox.objects.filter(pk=event.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.process_batch(), 1)
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'sent')
+        self.assertEqual(Notification.objects.filter(student=student).count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_one_failing_recipient_does_not_resend_the_others(self):
+        students = [
+            Student.objects.create(
+                student_id=f'S{n}', username=f's{n}', first_name='A', last_name='B', email=f's{n}@example.com',
+            )
+            for n in range(3)
+        ]
+        events = [outbox.enqueue('return_processed', student.id, book_title='Dune') for student in students]
+        send_messages = EmailBackend.send_messages
+
+        def refuse_s1(backend, messages):
+            if messages[0].to == ['s1@example.com']:
+                raise OSError('mailbox unavailable')
+            return send_messages(backend, messages)
+
+        with mock.patch.object(EmailBackend, 'send_messages', autospec=True, side_effect=refuse_s1), \
+                self.assertLogs('library.notifications', 'WARNING'):
+            self.assertEqual(outbox.process_batch(), 3)
+        statuses = dict(NotificationOutbox.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[event.id] for event in events], ['sent', 'pending', 'sent'])
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['s0@example.com', 's2@example.com'])
+
+        NotificationOutbox.objects.filter(status='pending').update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.process_batch(), 1)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f's{n}@example.com' for n in range(3)])
+        self.assertFalse(NotificationOutbox.objects.exclude(status='sent').exists())
+
+
+def make_student(n):
+    return Student.objects.create(
+        student_id=f'S{n}', username=f's{n}', first_name='A', last_name='B', email=f's{n}@example.com',
+    )
+
+
+def make_book(title='Dune', copies=1, available=None):
+    author = Author.objects.create(name=f'{title} Author')
+    return Book.objects.create(
+        title=title, author=author, isbn=f'isbn-{title}', total_copies=copies,
+        available_copies=copies if available is None else available,
+    )
+
+
+def make_loan(book, student, status='issued', days_late=0):
+    today = timezone.now().date()
+    return IssueRequest.objects.create(
+        book=book, student=student, status=status,
+        issue_date=today - timedelta(days=14 + days_late),
+        expected_return_date=today - timedelta(days=days_late),
+    )
+
+
+class AdmissionTests(TestCase):
+    def setUp(self):
+        self.student = make_student(1)
+        self.book = make_book()
+
+    def test_second_request_for_the_same_book_is_a_duplicate(self):
+        self.assertEqual(admission.admit_request(self.student, self.book)[0], admission.ADMITTED)
+        self.assertEqual(admission.admit_request(self.student, self.book), (admission.DUPLICATE, None))
+        self.assertEqual(IssueRequest.objects.filter(student=self.student, book=self.book).count(), 1)
+
+    def test_an_overdue_loan_of_the_book_is_a_duplicate(self):
+        make_loan(self.book, self.student, status='overdue', days_late=2)
+        self.assertEqual(admission.admit_request(self.student, self.book)[0], admission.DUPLICATE)
+
+    def test_unpaid_fines_block_requests(self):
+        Fine.objects.create(student=self.student, amount=Decimal('10.00'), invoice_number='INV-T-1')
+        self.assertEqual(admission.admit_request(self.student, self.book), (admission.FINES_DUE, None))
+
+    @override_settings(MAX_BOOKS_PER_STUDENT=2)
+    def test_issued_and_overdue_loans_count_toward_the_quota(self):
+        make_loan(make_book('Emma'), self.student)
+        make_loan(make_book('Ulysses'), self.student, status='overdue', days_late=1)
+        self.assertEqual(admission.admit_request(self.student, self.book), (admission.QUOTA_REACHED, None))
+        self.assertFalse(IssueRequest.objects.filter(book=self.book).exists())
+
+
+class HoldPromotionTests(TestCase):
+    def setUp(self):
+        self.book = make_book(available=0)
+        self.borrower, self.first, self.second, self.other = [make_student(n) for n in range(4)]
+        self.loan = make_loan(self.book, self.borrower)
+        for student in (self.first, self.second):
+            self.assertEqual(holds.place_hold(student, self.book)[0], holds.PLACED)
+
+    def promoted_request(self, student):
+        return IssueRequest.objects.get(book=self.book, student=student, status='requested')
+
+    def test_returned_copy_is_reserved_for_the_first_hold(self):
+        inventory.checkin_issue_request(self.loan.id)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        request = self.promoted_request(self.first)
+        self.assertEqual(BookHold.objects.get(student=self.first).status, 'fulfilled')
+        self.assertEqual(BookHold.objects.get(student=self.second).status, 'waiting')
+
+        # Nobody else can take the copy, and issuing it takes no second copy
+        self.assertEqual(holds.place_hold(self.other, self.book)[0], holds.PLACED)
+        self.assertEqual(inventory.checkout_issue_request(request.id)[0], inventory.ISSUED)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+    def test_rejecting_a_promoted_request_passes_the_copy_on(self):
+        inventory.checkin_issue_request(self.loan.id)
+        self.assertEqual(inventory.reject_issue_requests([self.promoted_request(self.first).id]), 1)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.promoted_request(self.second)
+
+    def test_batch_checkout_issues_promoted_requests_without_free_copies(self):
+        inventory.checkin_issue_requests([self.loan.id])
+        request = self.promoted_request(self.first)
+        result = inventory.checkout_issue_requests([request.id])
+        self.assertEqual(result['issued'], [request.id])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+
+class CheckinTests(TestCase):
+    def setUp(self):
+        self.student = make_student(1)
+        self.book = make_book(copies=2, available=0)
+
+    def test_late_return_accrues_the_fine_and_releases_the_copy(self):
+        loan = make_loan(self.book, self.student, status='overdue', days_late=3)
+        stats.invalidate()
+        before = stats.get_stats()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            outcome, _, fine = inventory.checkin_issue_request(loan.id)
+
+        self.assertEqual(outcome, inventory.RETURNED)
+        self.assertEqual((fine.days_overdue, fine.amount), (3, Decimal('15.00')))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+        after = stats.get_stats()
+        self.assertEqual(after['overdue'], before['overdue'] - 1)
+        self.assertEqual(after['unpaid_fines'], before['unpaid_fines'] + Decimal('15.00'))
+
+    def test_batch_return_counts_fines_and_skips_stale_requests(self):
+        late = make_loan(self.book, self.student, status='overdue', days_late=2)
+        on_time = make_loan(self.book, make_student(2))
+        returned = make_loan(self.book, make_student(3), status='returned')
+
+        result = inventory.checkin_issue_requests([late.id, on_time.id, returned.id])
+
+        self.assertEqual(sorted(result['returned']), sorted([late.id, on_time.id]))
+        self.assertEqual(result['stale'], [returned.id])
+        self.assertEqual(result['fines'], 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+
+    def test_overdue_loan_shows_as_issued_to_the_student(self):
+        make_loan(self.book, self.student, status='overdue', days_late=1)
+        self.assertEqual(self.book.get_status_for_student(self.student), 'issued')
+
+    def test_fine_from_a_returned_issue_is_refused(self):
+        loan = make_loan(self.book, self.student, status='returned', days_late=3)
+        admin = Admin.objects.create(username='admin', password='x', full_name='Admin', email='admin@example.com')
+        client = Client()
+        session = client.session
+        set_principal(session, 'admin', admin.pk)
+        session.save()
+        client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+        response = client.post(f'/admin/fines/create/{loan.id}/', follow=True)
+
+        self.assertFalse(Fine.objects.filter(issue_request=loan).exists())
+        self.assertIn('No fine created', [str(message) for message in response.context['messages']][0])
+
+
+class OverdueSweepTests(TestCase):
+    def test_sweep_marks_late_loans_and_accrues_their_fines_once(self):
+        student = make_student(1)
+        book = make_book(copies=2, available=0)
+        late = make_loan(book, student, days_late=2)
+        due_today = make_loan(book, make_student(2))
+        # A loan that fell due since it was saved (save() flags late loans itself)
+        IssueRequest.objects.filter(pk=late.pk).update(status='issued')
+
+        result = overdue.sweep_overdue()
+
+        self.assertEqual((result['marked_overdue'], result['fines_created']), (1, 1))
+        late.refresh_from_db()
+        due_today.refresh_from_db()
+        self.assertEqual((late.status, due_today.status), ('overdue', 'issued'))
+        self.assertEqual(Fine.objects.get(issue_request=late).amount, Decimal('10.00'))
+        # Running it again the same day writes nothing
+        self.assertEqual(overdue.sweep_overdue(), {'fines_created': 0, 'fines_updated': 0, 'marked_overdue': 0})
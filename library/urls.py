@@ -30,6 +30,13 @@ urlpatterns = [
     path('student/change-profile-picture/', views.student_change_profile_picture, name='student_change_profile_picture'),
     
     path('request-book/<int:book_id>/', views.request_book, name='request_book'),
+    path('hold-book/<int:book_id>/', views.place_hold, name='place_hold'),
+    path('cancel-hold/<int:hold_id>/', views.cancel_hold, name='cancel_hold'),
+    
+    # Student - Notifications (the stream at api/notifications/stream/ is served by library.streaming under ASGI)
+    path('api/notifications/', views.student_notifications, name='student_notifications'),
+    path('api/notifications/unread/', views.student_notifications_unread, name='student_notifications_unread'),
+    path('api/notifications/mark-read/', views.student_notifications_mark_read, name='student_notifications_mark_read'),
     
     # bKash Payment URLs
     path('pay-fine/<int:fine_id>/', views.pay_fine, name='pay_fine'),
@@ -38,12 +45,14 @@ urlpatterns = [
     
     # ============= ADMIN URLs =============
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('admin/metrics/login/', views.admin_login_metrics, name='admin_login_metrics'),
     
     # Admin - Issues
     path('admin/issues/', views.admin_issues, name='admin_issues'),
     path('admin/issue/accept/<int:request_id>/', views.accept_issue_request, name='accept_issue_request'),
     path('admin/issue/reject/<int:request_id>/', views.reject_issue_request, name='reject_issue_request'),
     path('admin/issue/return/<int:request_id>/', views.return_book_admin, name='return_book_admin'),
+    path('admin/issues/batch/', views.admin_issues_batch, name='admin_issues_batch'),
     
     # Admin - Books
     path('admin/books/', views.admin_books, name='admin_books'),
@@ -1,14 +1,32 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Q, Sum
+from django.db.models import Q
 from django.db import models, transaction
 from django.http import JsonResponse
 from django.utils import timezone
-from datetime import timedelta
-from .models import Admin, Student, Book, Author, IssueRequest, Fine, Notification
+from .models import Admin, Student, Book, Author, IssueRequest, Fine
+from .search import search_books
+from .student_index import search_students
+from .authors import author_catalog
+from .identity import get_principal, load_identity, principal_id, set_principal
+from .ledger import get_ledger
+from .notifications import enqueue
+from .fines import accrue_fines, calculate_fine, days_overdue
+from . import admission, availability, feed, holds, inventory, passwords, stats
+from .admission import admit_request
+from .availability import taken_identifiers
+from .passwords import HashingBusy
+from .inventory import (
+    checkin_issue_request, checkin_issue_requests, checkout_issue_request,
+    checkout_issue_requests, reject_issue_requests,
+)
+from .pagination import (
+    AUTHOR_ORDERING, BOOK_ORDERINGS, DEFAULT_PAGE_SIZE, RECENT_ORDERING, STUDENT_ORDERING,
+    paginate_keyset, paginate_ranked, wants_json,
+)
 from django.views.decorators.http import require_http_methods, require_GET
 from django.contrib.auth.hashers import make_password, check_password
-from django.apps import apps
 import logging
 
 
@@ -22,8 +40,29 @@ def login_choice(request):
     return render(request, 'library/login_choice.html')
 
 
-def admin_login(request):
-    """Admin login - checks library_admin table"""
+LOGIN_BUSY_MESSAGE = 'Too many people are signing in right now. Please try again in a few seconds.'
+
+render_async = sync_to_async(render)
+
+
+def _start_admin_session(request, admin):
+    # Replaces any student login in the same session
+    set_principal(request.session, 'admin', admin.id)
+    
+    # Update last login
+    admin.update_last_login()
+
+
+def _start_student_session(request, student):
+    # Replaces any admin login in the same session
+    set_principal(request.session, 'student', student.id)
+    
+    # Update last login
+    student.update_last_login()
+
+
+async def admin_login(request):
+    """Admin login - checks library_admin table; the password check waits on the hashing pool"""
     if request.method == 'POST':
         username = request.POST.get('username', '').strip()
         password = request.POST.get('password', '').strip()
@@ -31,39 +70,25 @@ def admin_login(request):
         # Validate input
         if not username or not password:
             messages.error(request, 'Please enter both username and password!')
-            return render(request, 'library/admin_login.html')
+            return await render_async(request, 'library/admin_login.html')
         
         try:
             # Check in Admin table
-            admin = Admin.objects.get(username=username)
+            admin = await Admin.objects.aget(username=username)
             
             # Check if account is active
             if not admin.is_active:
                 messages.error(request, 'Your admin account is inactive. Please contact the system administrator.')
-                return render(request, 'library/admin_login.html')
+                return await render_async(request, 'library/admin_login.html')
             
             # Check if password is set
             if not admin.password:
                 messages.error(request, 'Password not set. Please contact the system administrator.')
-                return render(request, 'library/admin_login.html')
+                return await render_async(request, 'library/admin_login.html')
             
             # Verify password
-            if admin.check_password(password):
-                # Clear any student session if exists
-                if 'is_student' in request.session:
-                    del request.session['is_student']
-                    del request.session['student_id']
-                    del request.session['student_username']
-                
-                # Set admin session
-                request.session['admin_id'] = admin.id
-                request.session['admin_username'] = admin.username
-                request.session['is_admin'] = True
-                request.session['user_type'] = 'admin'
-                
-                # Update last login
-                admin.update_last_login()
-                
+            if await admin.acheck_password(password):
+                await sync_to_async(_start_admin_session)(request, admin)
                 messages.success(request, f'Welcome Admin, {admin.full_name}!')
                 return redirect('admin_dashboard')
             else:
@@ -71,14 +96,17 @@ def admin_login(request):
                 
         except Admin.DoesNotExist:
             messages.error(request, 'Invalid username or admin account not found!')
+        except HashingBusy:
+            messages.error(request, LOGIN_BUSY_MESSAGE)
+            return await render_async(request, 'library/admin_login.html', status=503)
         except Exception as e:
             messages.error(request, f'An error occurred: {str(e)}')
     
-    return render(request, 'library/admin_login.html')
+    return await render_async(request, 'library/admin_login.html')
 
 
-def student_login(request):
-    """Student login - checks library_student table"""
+async def student_login(request):
+    """Student login - checks library_student table; the password check waits on the hashing pool"""
     if request.method == 'POST':
         username = request.POST.get('username', '').strip()
         password = request.POST.get('password', '').strip()
@@ -86,44 +114,30 @@ def student_login(request):
         # Validate input
         if not username or not password:
             messages.error(request, 'Please enter both username and password!')
-            return render(request, 'library/student_login.html')
+            return await render_async(request, 'library/student_login.html')
         
         try:
             # Check in Student table - check both is_active and status
-            student = Student.objects.get(username=username)
+            student = await Student.objects.aget(username=username)
             
             # Check if account is active
             if not student.is_active:
                 messages.error(request, 'Your account is inactive. Please contact the administrator.')
-                return render(request, 'library/student_login.html')
+                return await render_async(request, 'library/student_login.html')
             
             # Check if account is suspended
             if student.status == 'suspended':
                 messages.error(request, 'Your account has been suspended. Please contact the administrator.')
-                return render(request, 'library/student_login.html')
+                return await render_async(request, 'library/student_login.html')
             
             # Check if password is set
             if not student.password:
                 messages.error(request, 'Password not set. Please use forgot password to reset.')
-                return render(request, 'library/student_login.html')
+                return await render_async(request, 'library/student_login.html')
             
             # Verify password
-            if student.check_password(password):
-                # Clear any admin session if exists
-                if 'is_admin' in request.session:
-                    del request.session['is_admin']
-                    del request.session['admin_id']
-                    del request.session['admin_username']
-                
-                # Set student session
-                request.session['student_id'] = student.id
-                request.session['student_username'] = student.username
-                request.session['is_student'] = True
-                request.session['user_type'] = 'student'
-                
-                # Update last login
-                student.update_last_login()
-                
+            if await student.acheck_password(password):
+                await sync_to_async(_start_student_session)(request, student)
                 messages.success(request, f'Welcome, {student.full_name}!')
                 return redirect('student_dashboard')
             else:
@@ -131,10 +145,13 @@ def student_login(request):
                 
         except Student.DoesNotExist:
             messages.error(request, 'Invalid username or account not found!')
+        except HashingBusy:
+            messages.error(request, LOGIN_BUSY_MESSAGE)
+            return await render_async(request, 'library/student_login.html', status=503)
         except Exception as e:
             messages.error(request, f'An error occurred: {str(e)}')
     
-    return render(request, 'library/student_login.html')
+    return await render_async(request, 'library/student_login.html')
 
 
 def student_signup(request):
@@ -158,18 +175,15 @@ def student_signup(request):
             messages.error(request, 'Passwords do not match!')
             return redirect('student_signup')
         
-        # Check if username exists
-        if Student.objects.filter(username=username).exists():
+        # One query for all three unique fields
+        taken = taken_identifiers(username=username, student_id=student_id, email=email)
+        if 'username' in taken:
             messages.error(request, 'Username already exists!')
             return redirect('student_signup')
-        
-        # Check if student ID exists
-        if Student.objects.filter(student_id=student_id).exists():
+        if 'student_id' in taken:
             messages.error(request, 'Student ID already exists!')
             return redirect('student_signup')
-        
-        # Check if email exists
-        if Student.objects.filter(email=email).exists():
+        if 'email' in taken:
             messages.error(request, 'Email already exists!')
             return redirect('student_signup')
         
@@ -194,9 +208,7 @@ def student_signup(request):
             # Handle profile image upload
             if 'profile_image' in request.FILES:
                 student.profile_image = request.FILES['profile_image']
-            
-            # Password is already set, just save to ensure everything is committed
-            student.save()
+                student.save(update_fields=['profile_image'])
             
             messages.success(request, f'Account created successfully! Welcome {student.full_name}. Please login.')
             return redirect('student_login')
@@ -226,8 +238,7 @@ def validate_student_id(request):
     student_id = request.GET.get('student_id', '')
     
     if student_id:
-        exists = Student.objects.filter(student_id=student_id).exists()
-        return JsonResponse({'exists': exists})
+        return JsonResponse({'exists': availability.snapshot.student_id_taken(student_id)})
     
     return JsonResponse({'exists': False})
 
@@ -253,9 +264,7 @@ def validate_username(request):
         })
     
     # Check if username exists
-    exists = Student.objects.filter(username__iexact=username).exists()
-    
-    if exists:
+    if availability.snapshot.username_taken(username):
         return JsonResponse({
             'valid': False,
             'message': 'Username is already taken',
@@ -304,7 +313,6 @@ def forgot_password(request):
             if student.check_password(old_password):
                 # Set new password
                 student.set_password(new_password)
-                student.save()
                 
                 messages.success(request, 'Password reset successfully! Please login with your new password.')
                 return redirect('student_login')
@@ -313,13 +321,16 @@ def forgot_password(request):
                 
         except Student.DoesNotExist:
             messages.error(request, 'Invalid username or student ID!')
+        except HashingBusy:
+            messages.error(request, LOGIN_BUSY_MESSAGE)
+            return render(request, 'library/forgot_password.html', status=503)
     
     return render(request, 'library/forgot_password.html')
 
 
 def logout_view(request):
     """Logout for both admin and student"""
-    user_type = request.session.get('user_type')
+    user_type, _ = get_principal(request.session)
     
     # Clear all session data
     request.session.flush()
@@ -340,13 +351,9 @@ def admin_required(view_func):
     """Decorator to check if user is admin"""
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
-        if not request.session.get('is_admin'):
+        if not principal_id(request.session, 'admin'):
             messages.error(request, 'Please login to access this page.')
             return redirect('admin_login')
-        # Also check if admin_id exists in session
-        if not request.session.get('admin_id'):
-            messages.error(request, 'Session expired. Please login again.')
-            return redirect('admin_login')
         return view_func(request, *args, **kwargs)
     return wrapper
 
@@ -355,37 +362,44 @@ def student_required(view_func):
     """Decorator to check if user is student"""
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
-        if not request.session.get('is_student'):
+        if not principal_id(request.session, 'student'):
             messages.error(request, 'Please login to access this page.')
             return redirect('student_login')
-        # Also check if student_id exists in session
-        if not request.session.get('student_id'):
-            messages.error(request, 'Session expired. Please login again.')
-            return redirect('student_login')
         return view_func(request, *args, **kwargs)
     return wrapper
 
 
 def get_current_student(request):
     """Get current logged in student"""
-    student_id = request.session.get('student_id')
-    if student_id:
-        try:
-            return Student.objects.get(id=student_id)
-        except Student.DoesNotExist:
-            return None
-    return None
+    library_user = getattr(request, 'library_user', None)
+    if library_user is None:
+        return load_identity('student', principal_id(request.session, 'student'))
+    return library_user.student
 
 
 def get_current_admin(request):
     """Get current logged in admin"""
-    admin_id = request.session.get('admin_id')
-    if admin_id:
-        try:
-            return Admin.objects.get(id=admin_id)
-        except Admin.DoesNotExist:
-            return None
-    return None
+    library_user = getattr(request, 'library_user', None)
+    if library_user is None:
+        return load_identity('admin', principal_id(request.session, 'admin'))
+    return library_user.admin
+
+
+# ============= PAGINATION HELPERS =============
+
+BOOK_JSON_FIELDS = ('id', 'title', 'author.name', 'category', 'isbn', 'available_copies')
+
+
+def paginate_books(request, books, ranked_ids, sort_by, page_size, category=''):
+    """Paginate a catalog queryset, keeping search results in relevance order"""
+    if ranked_ids is not None and sort_by == 'relevance':
+        if category:
+            # Drop ranked ids that the category filter excluded
+            allowed = set(books.values_list('id', flat=True))
+            ranked_ids = [book_id for book_id in ranked_ids if book_id in allowed]
+        return paginate_ranked(request, books, ranked_ids, page_size)
+    ordering = BOOK_ORDERINGS.get(sort_by, BOOK_ORDERINGS['title'])
+    return paginate_keyset(request, books, ordering, page_size)
 
 
 # ============= PUBLIC VIEWS =============
@@ -394,84 +408,68 @@ def home(request):
     """Homepage - accessible to everyone"""
     query = request.GET.get('q', '')
     category = request.GET.get('category', '')
-    sort_by = request.GET.get('sort', 'title')
+    sort_by = request.GET.get('sort', 'relevance' if query else 'title')
     show_all = request.GET.get('all', '') == 'true'
     
     books = Book.objects.select_related('author').all()
     
     # Search
+    ranked_ids = None
     if query:
-        books = books.filter(
-            Q(title__icontains=query) |
-            Q(author__name__icontains=query) |
-            Q(category__icontains=query) |
-            Q(isbn__icontains=query)
-        )
+        books, ranked_ids = search_books(books, query)
     
     # Filter by category
     if category:
         books = books.filter(category__icontains=category)
     
-    # Sort
-    sort_options = {
-        'title': 'title',
-        'author': 'author__name',
-        '-title': '-title',
-        '-author': '-author__name',
-    }
-    books = books.order_by(sort_options.get(sort_by, 'title'))
-    
-    # Convert to list for template rendering
-    books_list = list(books)
-    
-    # Limit to first 12 books for homepage only if no search/filter and not showing all
-    if not query and not category and not show_all:
-        books_list = books_list[:12]
+    # Sort and paginate (only the current page is loaded)
+    page_size = 12 if not query and not category and not show_all else DEFAULT_PAGE_SIZE
+    books_page = paginate_books(request, books, ranked_ids, sort_by, page_size, category)
+    if wants_json(request):
+        return books_page.as_json(BOOK_JSON_FIELDS)
     
-    categories = Book.objects.values_list('category', flat=True).distinct()
-    
-    # Get current student if logged in
+    # Get current student if logged in, with their status for every book on the page
     student = get_current_student(request)
+    if student:
+        Book.annotate_status_for_student(books_page, student)
     
-    # Statistics for homepage
-    total_books = Book.objects.count()
-    total_members = Student.objects.filter(status='active').count()
-    active_borrows = IssueRequest.objects.filter(status='issued').count()
-    authors_count = Author.objects.count()
+    # Statistics and facets for homepage, served from the cache
+    library_stats = stats.get_stats()
+    facets = stats.get_catalog_facets()
     
     context = {
-        'books': books_list,
+        'books': books_page,
         'query': query,
-        'categories': categories,
+        'categories': facets['categories'],
         'selected_category': category,
         'sort_by': sort_by,
         'show_all': show_all,
         'student': student,
-        'is_admin': request.session.get('is_admin', False),
-        'is_student': request.session.get('is_student', False),
-        'total_books': total_books,
-        'total_members': total_members,
-        'active_borrows': active_borrows,
-        'authors_count': authors_count,
+        'is_admin': request.library_user.is_admin,
+        'is_student': request.library_user.is_student,
+        'total_books': library_stats['books'],
+        'total_members': library_stats['active_students'],
+        'active_borrows': library_stats['issued'] + library_stats['overdue'],
+        'authors_count': facets['authors'],
     }
     return render(request, 'library/public_home.html', context)
 
 
 def book_detail(request, pk):
     """Book detail page"""
-    book = get_object_or_404(Book, pk=pk)
+    book = get_object_or_404(Book.objects.select_related('author'), pk=pk)
     student = get_current_student(request)
-    book_status = None
-    
-    if student:
-        book_status = book.get_status_for_student(student)
+    Book.annotate_status_for_student([book], student)
+    book_status = book.student_status
+    hold = holds.get_waiting_hold(student, book) if student and book_status == 'not available' else None
     
     context = {
         'book': book,
         'student': student,
         'book_status': book_status,
-        'is_admin': request.session.get('is_admin', False),
-        'is_student': request.session.get('is_student', False),
+        'hold': hold,
+        'is_admin': request.library_user.is_admin,
+        'is_student': request.library_user.is_student,
     }
     return render(request, 'library/book_detail.html', context)
 
@@ -487,17 +485,18 @@ def student_dashboard(request):
         messages.error(request, 'Session expired. Please login again.')
         return redirect('student_login')
     
-    # Get statistics
-    active_issues = IssueRequest.objects.filter(student=student, status='issued')
-    pending_requests = IssueRequest.objects.filter(student=student, status='requested')
+    # Counters come from the student's ledger row
+    ledger = get_ledger(student)
+    active_issues = IssueRequest.objects.filter(student=student, status__in=['issued', 'overdue']).select_related('book')
     unpaid_fines = Fine.objects.filter(student=student, is_paid=False)
     
     context = {
         'student': student,
+        'ledger': ledger,
         'active_issues': active_issues,
-        'pending_requests': pending_requests,
+        'active_loans': ledger.active_loans + ledger.overdue_count,
         'unpaid_fines': unpaid_fines,
-        'total_fine': student.total_fines,
+        'total_fine': ledger.outstanding_fines,
     }
     return render(request, 'library/student_dashboard.html', context)
 
@@ -513,37 +512,28 @@ def student_books(request):
     
     query = request.GET.get('q', '')
     category = request.GET.get('category', '')
-    sort_by = request.GET.get('sort', 'title')
+    sort_by = request.GET.get('sort', 'relevance' if query else 'title')
     
     books = Book.objects.select_related('author').all()
     
     # Search
+    ranked_ids = None
     if query:
-        books = books.filter(
-            Q(title__icontains=query) |
-            Q(author__name__icontains=query) |
-            Q(category__icontains=query) |
-            Q(isbn__icontains=query)
-        )
+        books, ranked_ids = search_books(books, query)
     
     # Filter by category
     if category:
         books = books.filter(category__icontains=category)
     
-    # Sort
-    sort_options = {
-        'title': 'title',
-        'author': 'author__name',
-        '-title': '-title',
-        '-author': '-author__name',
-    }
-    books = books.order_by(sort_options.get(sort_by, 'title'))
-    
-    categories = Book.objects.values_list('category', flat=True).distinct()
+    # Sort and paginate (only the current page is loaded)
+    books = paginate_books(request, books, ranked_ids, sort_by, DEFAULT_PAGE_SIZE, category)
+    Book.annotate_status_for_student(books, student)
+    if wants_json(request):
+        return books.as_json(BOOK_JSON_FIELDS + ('student_status',))
     
     context = {
         'books': books,
-        'categories': categories,
+        'categories': stats.get_catalog_facets()['categories'],
         'query': query,
         'category': category,
         'sort_by': sort_by,
@@ -564,7 +554,8 @@ def student_change_profile_picture(request):
     if request.method == 'POST':
         if 'profile_image' in request.FILES:
             student.profile_image = request.FILES['profile_image']
-            student.save()
+            # The student may come from the identity cache: write only this column
+            student.save(update_fields=['profile_image'])
             messages.success(request, 'Profile picture updated successfully!')
         else:
             messages.error(request, 'Please select an image file.')
@@ -582,7 +573,7 @@ def student_fines(request):
         return redirect('student_login')
     
     # Get all fines for the student
-    fines = Fine.objects.filter(student=student).order_by('-created_at')
+    fines = Fine.objects.filter(student=student).select_related('issue_request__book').order_by('-created_at')
     
     # Calculate totals
     total_pending = fines.filter(is_paid=False).aggregate(models.Sum('amount'))['amount__sum'] or 0
@@ -611,11 +602,11 @@ def student_issues(request):
         try:
             student = Student.objects.get(user=request.user)
         except Student.DoesNotExist:
-            student_id = request.GET.get('student_id') or request.session.get('student_id')
+            student_id = request.GET.get('student_id') or principal_id(request.session, 'student')
             if student_id:
                 student = get_object_or_404(Student, pk=student_id)
     else:
-        student_id = request.GET.get('student_id') or request.session.get('student_id')
+        student_id = request.GET.get('student_id') or principal_id(request.session, 'student')
         if student_id:
             student = get_object_or_404(Student, pk=student_id)
 
@@ -632,6 +623,7 @@ def student_issues(request):
 
     context = {
         'issues': issues,
+        'holds': holds.waiting_holds(student),
         'student': student,
     }
     return render(request, 'library/student_issues.html', context)
@@ -650,36 +642,120 @@ def request_book(request, book_id):
     
     # Check if book is available
     if not book.is_available():
-        messages.error(request, 'Book is not available!')
+        messages.error(request, 'Book is not available! Place a hold to join the queue for the next copy.')
         return redirect('book_detail', pk=book_id)
     
-    # Check if student already has an active request/issue for this book
-    existing = IssueRequest.objects.filter(
-        book=book,
-        student=student,
-        status__in=['requested', 'issued']
-    ).first()
-    
-    if existing:
+    # Duplicate, fine and quota checks run under a lock on the student's ledger
+    outcome, _ = admit_request(student, book)
+    if outcome == admission.DUPLICATE:
         messages.warning(request, 'You already have an active request/issue for this book!')
         return redirect('book_detail', pk=book_id)
-    
-    # Check if student has unpaid fines
-    if student.total_fines > 0:
+    if outcome == admission.FINES_DUE:
         messages.error(request, 'Please clear your fines before requesting new books!')
         return redirect('student_fines')
-    
-    # Create issue request
-    IssueRequest.objects.create(
-        book=book,
-        student=student,
-        status='requested'
-    )
+    if outcome == admission.QUOTA_REACHED:
+        messages.error(
+            request,
+            f'You can hold at most {admission.max_books_per_student()} books at a time, '
+            'including pending requests.'
+        )
+        return redirect('student_issues')
     
     messages.success(request, f'Request sent for "{book.title}". Waiting for approval.')
     return redirect('student_issues')
 
 
+@require_http_methods(["POST"])
+@student_required
+def place_hold(request, book_id):
+    """Join the hold queue of a book with no copies left"""
+    student = get_current_student(request)
+    
+    if not student:
+        messages.error(request, 'Session expired. Please login again.')
+        return redirect('student_login')
+    
+    book = get_object_or_404(Book, pk=book_id)
+    outcome, hold = holds.place_hold(student, book)
+    if outcome == holds.AVAILABLE:
+        messages.info(request, 'A copy is available now, you can request it directly.')
+    elif outcome == holds.ALREADY_OPEN:
+        messages.warning(request, 'You already have an active request/issue for this book!')
+    elif outcome == holds.ALREADY_HOLDING:
+        messages.info(request, 'You are already in the queue for this book.')
+    else:
+        position = holds.get_waiting_hold(student, book).position
+        messages.success(request, f'Hold placed for "{book.title}". You are #{position} in the queue.')
+    return redirect('book_detail', pk=book_id)
+
+
+@require_http_methods(["POST"])
+@student_required
+def cancel_hold(request, hold_id):
+    """Leave the hold queue of a book"""
+    student = get_current_student(request)
+    
+    if not student:
+        messages.error(request, 'Session expired. Please login again.')
+        return redirect('student_login')
+    
+    if holds.cancel_hold(student, hold_id):
+        messages.success(request, 'Your hold has been cancelled.')
+    else:
+        messages.warning(request, 'This hold is no longer active.')
+    return redirect('student_issues')
+
+
+# ============= NOTIFICATION VIEWS =============
+
+@student_required
+@require_GET
+def student_notifications(request):
+    """Notification feed, newest first, with cursor pagination"""
+    student = get_current_student(request)
+    if not student:
+        return JsonResponse({'success': False, 'message': 'Session expired. Please login again.'}, status=401)
+    
+    notifications = paginate_keyset(request, feed.notifications_for(student), RECENT_ORDERING)
+    return notifications.as_json(
+        ['id', 'title', 'message', 'notification_type', 'is_read', 'created_at'],
+        unread=feed.unread_count(student.pk),
+        version=feed.get_version(student.pk),
+    )
+
+
+@student_required
+@require_GET
+def student_notifications_unread(request):
+    """Cached unread count and feed version, for badges and pollers"""
+    student_id = principal_id(request.session, 'student')
+    return JsonResponse({'unread': feed.unread_count(student_id), 'version': feed.get_version(student_id)})
+
+
+@student_required
+@require_http_methods(["POST"])
+def student_notifications_mark_read(request):
+    """Mark the posted notification ids, or all of them with all=1, as read"""
+    student = get_current_student(request)
+    if not student:
+        return JsonResponse({'success': False, 'message': 'Session expired. Please login again.'}, status=401)
+    
+    if request.POST.get('all'):
+        notification_ids = None
+    else:
+        try:
+            notification_ids = [int(notification_id) for notification_id in request.POST.getlist('ids')]
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Invalid notification id.'}, status=400)
+    
+    marked = feed.mark_read(student, notification_ids)
+    return JsonResponse({
+        'success': True,
+        'message': f'{marked} notification(s) marked as read.',
+        'marked': marked,
+    })
+
+
 # ============= PAYMENT VIEWS =============
 
 @student_required
@@ -730,34 +806,30 @@ def admin_dashboard(request):
         messages.error(request, 'Session expired. Please login again.')
         return redirect('admin_login')
     
-    # Statistics
-    total_books = Book.objects.count()
-    total_students = Student.objects.filter(status='active').count()
-    active_issues = IssueRequest.objects.filter(status='issued').count()
-    pending_requests = IssueRequest.objects.filter(status='requested').count()
-    overdue_issues = IssueRequest.objects.filter(status='overdue').count()
-    unpaid_fines = Fine.objects.filter(is_paid=False).aggregate(
-        total=models.Sum('amount')
-    )['total'] or 0
-    
-    # Get recent counts instead of full lists
-    recent_requests_count = IssueRequest.objects.filter(status='requested').count()
-    recent_issues_count = IssueRequest.objects.filter(status='issued').count()
+    # Statistics (one cache read, see library.stats)
+    library_stats = stats.get_stats()
     
     context = {
         'admin': admin,
-        'total_books': total_books,
-        'total_students': total_students,
-        'active_issues': active_issues,
-        'pending_requests': pending_requests,
-        'overdue_issues': overdue_issues,
-        'unpaid_fines': unpaid_fines,
-        'recent_requests_count': recent_requests_count,
-        'recent_issues_count': recent_issues_count,
+        'total_books': library_stats['books'],
+        'total_students': library_stats['active_students'],
+        'active_issues': library_stats['issued'] + library_stats['overdue'],
+        'pending_requests': library_stats['requested'],
+        'overdue_issues': library_stats['overdue'],
+        'unpaid_fines': library_stats['unpaid_fines'],
+        'recent_requests_count': library_stats['requested'],
+        'recent_issues_count': library_stats['issued'] + library_stats['overdue'],
     }
     return render(request, 'library/admin_dashboard.html', context)
 
 
+@admin_required
+@require_GET
+def admin_login_metrics(request):
+    """Queue depth and wait times of this worker's password hashing pool"""
+    return JsonResponse(passwords.metrics())
+
+
 @admin_required
 def admin_issues(request):
     """Admin issues management"""
@@ -770,14 +842,9 @@ def admin_issues(request):
     # Get filter from GET request
     filter_by = request.GET.get("filter", "all")
     
-    issues = IssueRequest.objects.select_related('student', 'book').all()
-    
-    # Update overdue status for all issued books (real-time)
-    from datetime import date
-    today = date.today()
-    for issue in issues.filter(status='issued'):
-        if issue.expected_return_date and today > issue.expected_return_date:
-            issue.update_overdue_status()
+    # Overdue transitions and fines are handled by the overdue sweeper
+    # (library.overdue), so this page only reads.
+    issues = IssueRequest.objects.select_related('student', 'book__author').all()
     
     # Apply filter
     if filter_by == "pending":
@@ -789,8 +856,11 @@ def admin_issues(request):
     elif filter_by == "returned":
         issues = issues.filter(status="returned")
     
+    # Only the current page is loaded
+    issues_page = paginate_keyset(request, issues, RECENT_ORDERING)
+    
     # Calculate real-time fines for each issue
-    issues_list = list(issues)
+    issues_list = issues_page.items
     for issue in issues_list:
         issue.real_time_fine = issue.calculate_overdue_fine()
         if issue.status in ['issued', 'overdue']:
@@ -806,8 +876,14 @@ def admin_issues(request):
             else:
                 issue.days_overdue = 0
     
+    if wants_json(request):
+        return issues_page.as_json((
+            'id', 'book.title', 'student.student_id', 'student.full_name', 'status',
+            'request_date', 'issue_date', 'expected_return_date', 'real_time_fine',
+        ))
+    
     context = {
-        "issues": issues_list,
+        "issues": issues_page,
         "filter_by": filter_by,
         "admin": admin,
     }
@@ -824,26 +900,20 @@ def accept_issue_request(request, request_id):
         messages.error(request, 'Session expired. Please login again.')
         return redirect('admin_login')
     
-    issue_request = get_object_or_404(IssueRequest, id=request_id, status='requested')
-    book = issue_request.book
+    issue_request = get_object_or_404(
+        IssueRequest.objects.select_related('book', 'student'), id=request_id, status='requested'
+    )
     
-    # Check if book is available
-    if book.available_copies <= 0:
+    # Reserve a copy atomically; fails if another admin took the last one
+    outcome, _ = checkout_issue_request(issue_request.id)
+    if outcome == inventory.UNAVAILABLE:
         messages.error(request, 'Book is not available!')
         return redirect('admin_issues')
+    if outcome == inventory.STALE:
+        messages.warning(request, 'This request has already been processed.')
+        return redirect('admin_issues')
     
-    # Update issue request
-    from datetime import date
-    issue_request.status = 'issued'
-    issue_request.issue_date = date.today()
-    issue_request.expected_return_date = date.today() + timedelta(days=14)
-    issue_request.save()
-    
-    # Decrease available copies
-    book.available_copies -= 1
-    book.save()
-    
-    messages.success(request, f'Book "{book.title}" issued to {issue_request.student.full_name}')
+    messages.success(request, f'Book "{issue_request.book.title}" issued to {issue_request.student.full_name}')
     return redirect('admin_issues')
 
 
@@ -859,8 +929,10 @@ def reject_issue_request(request, request_id):
     issue_request = get_object_or_404(IssueRequest, id=request_id, status='requested')
     book_title = issue_request.book.title
     
-    issue_request.status = 'rejected'
-    issue_request.save()
+    # Also hands a copy set aside for a promoted hold to the next hold
+    if not reject_issue_requests([issue_request.id]):
+        messages.warning(request, 'This request has already been processed.')
+        return redirect('admin_issues')
     
     messages.success(request, f'Request for "{book_title}" has been rejected.')
     return redirect('admin_issues')
@@ -875,57 +947,63 @@ def return_book_admin(request, request_id):
         messages.error(request, 'Session expired. Please login again.')
         return redirect('admin_login')
     
-    issue_request = get_object_or_404(IssueRequest, id=request_id, status__in=['issued', 'overdue'])
-    book = issue_request.book
-    
-    # Update overdue status and generate fine if needed
-    issue_request.update_overdue_status()
+    issue_request = get_object_or_404(
+        IssueRequest.objects.select_related('book'), id=request_id, status__in=['issued', 'overdue']
+    )
     
-    # Calculate fine if overdue (5 tk per day)
-    from datetime import date
-    from decimal import Decimal
+    # Mark returned, accrue any overdue fine and put the copy back atomically
+    outcome, _, fine = checkin_issue_request(issue_request.id)
+    if outcome == inventory.STALE:
+        messages.warning(request, 'This book has already been returned.')
+        return redirect('admin_issues')
     
     fine_message = ""
-    if issue_request.expected_return_date and date.today() > issue_request.expected_return_date:
-        days_overdue = (date.today() - issue_request.expected_return_date).days
-        fine_amount = Decimal(days_overdue) * Decimal('5')  # 5 tk per day
-        
-        # Generate unique invoice number
-        from django.utils import timezone
-        timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
-        invoice_number = f"INV-RETURN-{issue_request.id}-{timestamp}"
-        
-        # Create or update fine
-        fine, created = Fine.objects.get_or_create(
-            issue_request=issue_request,
-            defaults={
-                'student': issue_request.student,
-                'amount': fine_amount,
-                'days_overdue': days_overdue,
-                'description': f'Overdue fine: {days_overdue} days × 5 tk = {fine_amount} tk',
-                'invoice_number': invoice_number,
-            }
-        )
-        
-        if not created:
-            # Update existing fine
-            fine.amount = fine_amount
-            fine.days_overdue = days_overdue
-            fine.description = f'Overdue fine: {days_overdue} days × 5 tk = {fine_amount} tk'
-            fine.save()
-        
-        fine_message = f" Fine of {fine_amount} tk generated for {days_overdue} overdue day(s)."
+    if fine:
+        fine_message = f" Fine of {fine.amount} tk generated for {fine.days_overdue} overdue day(s)."
     
-    # Update issue request
-    issue_request.status = 'returned'
-    issue_request.actual_return_date = date.today()
-    issue_request.save()
+    messages.success(request, f'Book "{issue_request.book.title}" returned successfully!{fine_message}')
+    return redirect('admin_issues')
+
+
+@require_http_methods(["POST"])
+@admin_required
+def admin_issues_batch(request):
+    """Accept, reject or return several issue requests in one transaction"""
+    action = request.POST.get('action', '')
+    try:
+        issue_ids = [int(issue_id) for issue_id in request.POST.getlist('issue_ids')]
+    except ValueError:
+        issue_ids = []
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
     
-    # Increase available copies
-    book.available_copies += 1
-    book.save()
+    if not issue_ids or action not in ('accept', 'reject', 'return'):
+        if is_ajax:
+            return JsonResponse({
+                'success': False,
+                'message': 'Select at least one issue and an action.'
+            }, status=400)
+        messages.error(request, 'Select at least one issue and an action.')
+        return redirect('admin_issues')
     
-    messages.success(request, f'Book "{book.title}" returned successfully!{fine_message}')
+    if action == 'accept':
+        result = checkout_issue_requests(issue_ids)
+        message = f"{len(result['issued'])} book(s) issued."
+        if result['unavailable']:
+            message += f" {len(result['unavailable'])} request(s) left pending: no copies available."
+    elif action == 'reject':
+        rejected = reject_issue_requests(issue_ids)
+        result = {'rejected': rejected}
+        message = f"{rejected} request(s) rejected."
+    else:
+        result = checkin_issue_requests(issue_ids)
+        message = f"{len(result['returned'])} book(s) returned."
+        if result['fines']:
+            message += f" {result['fines']} overdue fine(s) generated."
+    
+    if is_ajax:
+        return JsonResponse({'success': True, 'message': message, 'result': result})
+    
+    messages.success(request, message)
     return redirect('admin_issues')
 
 
@@ -948,6 +1026,10 @@ def admin_books(request):
             Q(isbn__icontains=query)
         )
     
+    books = paginate_keyset(request, books, BOOK_ORDERINGS['title'])
+    if wants_json(request):
+        return books.as_json(BOOK_JSON_FIELDS + ('total_copies',))
+    
     context = {
         'books': books,
         'query': query,
@@ -1079,10 +1161,15 @@ def admin_authors(request):
         messages.error(request, 'Session expired. Please login again.')
         return redirect('admin_login')
     
-    authors = Author.objects.all().order_by('name')
+    query = request.GET.get('search', '')
+    authors = paginate_keyset(request, author_catalog(query), AUTHOR_ORDERING)
+    if wants_json(request):
+        return authors.as_json(('id', 'name', 'book_count', 'available_copies', 'active_loans'))
+    
     context = {
         'admin': admin,
         'authors': authors,
+        'query': query,
     }
     return render(request, 'library/admin_authors.html', context)
 
@@ -1179,7 +1266,7 @@ def admin_students(request):
         return redirect('admin_login')
     
     query = request.GET.get('q', '')
-    students = Student.objects.all().order_by('student_id')
+    students = Student.objects.all()
     
     if query:
         students = students.filter(
@@ -1190,6 +1277,12 @@ def admin_students(request):
             Q(email__icontains=query)
         )
     
+    students = paginate_keyset(request, students, STUDENT_ORDERING)
+    if wants_json(request):
+        return students.as_json((
+            'id', 'student_id', 'username', 'full_name', 'email', 'phone', 'department', 'status',
+        ))
+    
     context = {
         'admin': admin,
         'students': students,
@@ -1231,14 +1324,13 @@ def admin_student_add(request):
                 enrollment_year=int(enrollment_year) if enrollment_year else None,
                 status='active',
                 is_active=True,
+                password=make_password(password),
             )
-            student.set_password(password)
             
             # Handle profile image upload
             if 'profile_image' in request.FILES:
                 student.profile_image = request.FILES['profile_image']
-            
-            student.save()
+                student.save(update_fields=['profile_image'])
             
             messages.success(request, f'Student "{student.full_name}" added successfully!')
             return redirect('admin_students')
@@ -1279,7 +1371,8 @@ def admin_student_edit(request, pk):
             student.profile_image = request.FILES['profile_image']
         
         if request.POST.get('password'):
-            student.set_password(request.POST.get('password'))
+            # Saved together with the other fields below
+            student.password = make_password(request.POST.get('password'))
         
         student.save()
         
@@ -1327,13 +1420,14 @@ def admin_student_details(request, pk):
         return redirect('admin_login')
     
     student = get_object_or_404(Student, pk=pk)
-    issues = IssueRequest.objects.filter(student=student).order_by('-request_date')
+    issues = IssueRequest.objects.filter(student=student).select_related('book').order_by('-request_date')
     fines = Fine.objects.filter(student=student).order_by('-created_at')
     
     # Calculate statistics
     total_issues = issues.count()
-    active_issues = issues.filter(status='issued').count()
-    total_fines_amount = fines.filter(is_paid=False).aggregate(total=Sum('amount'))['total'] or 0
+    ledger = get_ledger(student)
+    active_issues = ledger.active_loans
+    total_fines_amount = ledger.outstanding_fines
     
     context = {
         'admin': admin,
@@ -1368,7 +1462,6 @@ def admin_change_password(request, pk):
             return redirect('admin_change_password', pk=pk)
         
         student.set_password(new_password)
-        student.save()
         
         messages.success(request, f'Password changed for {student.full_name}')
         return redirect('admin_student_details', pk=pk)
@@ -1383,13 +1476,20 @@ def admin_change_password(request, pk):
 @admin_required
 def admin_fines(request):
     """View all fines"""
-    fines = Fine.objects.all().select_related('student', 'issue_request').order_by('-created_at')
+    fines = Fine.objects.all().select_related('student', 'issue_request')
     
     # Calculate statistics
     total_unpaid = fines.filter(is_paid=False).aggregate(models.Sum('amount'))['amount__sum'] or 0
     total_paid = fines.filter(is_paid=True).aggregate(models.Sum('amount'))['amount__sum'] or 0
     pending_count = fines.filter(is_paid=False).count()
     
+    fines = paginate_keyset(request, fines, RECENT_ORDERING)
+    if wants_json(request):
+        return fines.as_json((
+            'id', 'student.student_id', 'student.full_name', 'amount', 'days_overdue',
+            'description', 'is_paid', 'payment_date', 'invoice_number', 'created_at',
+        ))
+    
     context = {
         'fines': fines,
         'total_unpaid': total_unpaid,
@@ -1412,25 +1512,34 @@ def admin_fine_create(request, issue_id):
     
     # Calculate fine
     today = timezone.now().date()
-    due_date = issue.expected_return_date
-    
-    if due_date and today > due_date:
-        days_overdue = (today - due_date).days
-        fine_amount = days_overdue * 5.00
-    else:
-        fine_amount = 0.00
+    overdue_days = days_overdue(issue.expected_return_date, today)
+    fine_amount = calculate_fine(overdue_days)
     
     if request.method == 'POST':
         try:
-            fine, created = Fine.objects.get_or_create(
-                issue_request=issue,
-                defaults={
-                    'student': issue.student,
-                    'amount': fine_amount,
-                    'days_overdue': int((today - due_date).days) if due_date else 0,
-                    'description': f'Book overdue: {issue.book.title}',
-                }
-            )
+            if overdue_days:
+                # Only loans still out accrue; returned ones were fined at check-in
+                result = accrue_fines([issue.id], today=today)
+                if not (result['fines_created'] or result['fines_updated']):
+                    if Fine.objects.filter(issue_request=issue).exists():
+                        messages.info(request, 'The fine for this loan is already up to date.')
+                        return redirect('admin_fines')
+                    messages.error(
+                        request,
+                        f'No fine created: the book is {issue.get_status_display().lower()}, '
+                        'only books still out on loan accrue overdue fines.'
+                    )
+                    return redirect('admin_fines')
+            else:
+                Fine.objects.get_or_create(
+                    issue_request=issue,
+                    defaults={
+                        'student': issue.student,
+                        'amount': fine_amount,
+                        'days_overdue': 0,
+                        'description': f'Book overdue: {issue.book.title}',
+                    }
+                )
             
             messages.success(request, f'Fine created: ৳{fine_amount}')
             return redirect('admin_fines')
@@ -1532,52 +1641,11 @@ def admin_fine_select_issue(request):
     }
     return render(request, 'library/admin_fine_select_issue.html', context)
 
-@require_http_methods(["GET"])
 @admin_required
+@require_GET
 def admin_search_student(request):
-    """Search for students by ID, name, email, or phone number"""
-    q = request.GET.get('q', '').strip()
-    print(f"Search query: {q}")  # Debug log
-    
-    if not q:
-        print("No search query provided")  # Debug log
-        return JsonResponse({'results': []})
-
-    try:
-        # Broaden the search criteria
-        query = (
-            Q(student_id__icontains=q) |
-            Q(username__icontains=q) |
-            Q(first_name__icontains=q) |
-            Q(last_name__icontains=q) |
-            Q(email__icontains=q) |
-            Q(phone__icontains=q)
-        )
-        
-        # Search in both active and inactive students
-        matches = Student.objects.filter(query).order_by('first_name')[:50]
-        
-        print(f"Found {matches.count()} matches")  # Debug log
-        
-        results = []
-        for student in matches:
-            full_name = f"{student.first_name} {student.last_name}".strip()
-            results.append({
-                'id': student.id,
-                'student_id': student.student_id or '',
-                'full_name': full_name,
-                'email': student.email or '',
-                'department': getattr(student, 'department', '') or '',
-                'phone': getattr(student, 'phone', '') or ''
-            })
-            
-            print(f"Added student: {full_name} (ID: {student.id})")  # Debug log
-
-        return JsonResponse({'results': results})
-        
-    except Exception as e:
-        print(f"Error in admin_search_student: {str(e)}")  # Debug log
-        return JsonResponse({'results': [], 'error': str(e)}, status=500)
+    """AJAX typeahead: students matching an ID, username, name, email or phone prefix"""
+    return JsonResponse({'results': search_students(request.GET.get('q', ''))})
 
 
 @require_http_methods(["GET", "POST"])
@@ -1655,19 +1723,8 @@ def admin_fine_create_custom(request):
                 )
                 fine.save()  # Save the fine to generate an ID
                 
-                # Create notification if possible
-                try:
-                    if hasattr(student, 'user'):
-                        Notification = apps.get_model('library', 'Notification')
-                        Notification.objects.create(
-                            user=student.user,
-                            title='New Fine Issued',
-                            message=f'A fine of ৳{amount:.2f} has been issued to your account. Reason: {description}',
-                            notification_type='fine'
-                        )
-                except Exception as notif_error:
-                    logger.warning(f"Could not create notification: {str(notif_error)}")
-                    # Continue with fine creation even if notification fails
+                # Delivered later by the notification worker
+                enqueue('fine_created', student.id, amount=f'{amount:.2f}', description=description)
                 
                 if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                     return JsonResponse({
@@ -1698,51 +1755,3 @@ def admin_fine_create_custom(request):
 def test_template_view(request):
     """Test view to check if template is being loaded correctly."""
     return render(request, 'library/admin_fine_create_custom_modal.html', {'admin': get_current_admin(request)})
-
-
-@admin_required
-@require_GET
-def admin_search_student(request):
-    """AJAX endpoint: search students (includes registered/active students)."""
-    q = request.GET.get('q', '').strip()
-    print(f"Search query: {q}")  # Debug log
-    
-    if not q:
-        print("No search query provided")  # Debug log
-        return JsonResponse({'results': []})
-
-    try:
-        # Broaden the search criteria
-        query = (
-            Q(student_id__icontains=q) |
-            Q(username__icontains=q) |
-            Q(first_name__icontains=q) |
-            Q(last_name__icontains=q) |
-            Q(email__icontains=q) |
-            Q(phone__icontains=q)
-        )
-        
-        # Search in both active and inactive students
-        matches = Student.objects.filter(query).order_by('first_name')[:50]
-        
-        print(f"Found {matches.count()} matches")  # Debug log
-        
-        results = []
-        for student in matches:
-            full_name = f"{student.first_name} {student.last_name}".strip()
-            results.append({
-                'id': student.id,
-                'student_id': student.student_id or '',
-                'full_name': full_name,
-                'email': student.email or '',
-                'department': getattr(student, 'department', '') or '',
-                'phone': getattr(student, 'phone', '') or ''
-            })
-            
-            print(f"Added student: {full_name} (ID: {student.id})")  # Debug log
-
-        return JsonResponse({'results': results})
-        
-    except Exception as e:
-        print(f"Error in admin_search_student: {str(e)}")  # Debug log
-        return JsonResponse({'results': [], 'error': str(e)}, status=500)
\ No newline at end of file
@@ -13,4 +13,11 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up; serves /api/notifications/stream/.
+# Everything else goes to Django, where the login views are async and wait
+# for the password hashing pool (library.passwords) without holding a thread.
+from library.streaming import NotificationStreamApp  # noqa: E402
+
+application = NotificationStreamApp(django_application)
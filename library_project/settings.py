@@ -27,6 +27,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'library.middleware.LibraryUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -52,6 +53,29 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'library_project.wsgi.application'
 
+# Cache: local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) to share it across workers
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='library-cache'),
+    }
+}
+# Local memory (and dummy) caches are private to each worker process; features
+# that rely on the cache being shared fall back to short-lived or no caching
+SHARED_CACHE = not CACHES['default']['BACKEND'].endswith(('LocMemCache', 'DummyCache'))
+
+# Sessions only hold the logged in principal (library.identity). With the
+# per-process local-memory cache they live in signed cookies; with a shared
+# cache they are read from the cache and written through to the database.
+SESSION_ENGINE = config('SESSION_ENGINE', default=(
+    'django.contrib.sessions.backends.cached_db'
+    if SHARED_CACHE
+    else 'django.contrib.sessions.backends.signed_cookies'
+))
+# Flash messages travel in a cookie instead of the session
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.mysql',
@@ -109,4 +133,38 @@ BKASH_CALLBACK_URL = 'http://127.0.0.1:8000/bkash/callback/'  # Update for produ
 # Library Settings
 FINE_PER_DAY = 5.00
 DEFAULT_ISSUE_DAYS = 14
-MAX_BOOKS_PER_STUDENT = 3
\ No newline at end of file
+MAX_BOOKS_PER_STUDENT = 3
+OVERDUE_SWEEP_INTERVAL = 3600  # seconds between in-process overdue sweeps, 0 to disable
+# seconds a logged in admin/student row is cached; only a shared cache sees the
+# invalidation from other workers, so a per-process cache does not keep them
+IDENTITY_CACHE_TTL = 60 if SHARED_CACHE else 0
+# seconds between full recounts of the dashboard counters; other workers cannot
+# see a per-process cache's increments, so recount often without a shared cache
+STATS_RECONCILE_INTERVAL = 600 if SHARED_CACHE else 5
+
+# Search Settings
+SEARCH_INDEX_MAX_AGE = 300  # seconds before a worker rebuilds its catalog index
+CATALOG_CACHE_TTL = 300  # seconds catalog facets stay cached per catalog version
+
+# Login Settings
+PASSWORD_HASH_WORKERS = config('PASSWORD_HASH_WORKERS', default=2, cast=int)  # hashing threads per process
+PASSWORD_HASH_MAX_PENDING = config('PASSWORD_HASH_MAX_PENDING', default=32, cast=int)  # waiting checks before logins are turned away
+ACTIVITY_FLUSH_INTERVAL = 30  # seconds buffered last_login times wait before being written, 0 to write at once
+ACTIVITY_FLUSH_SIZE = 500  # buffered logins that trigger an early write
+
+# Notification Settings
+NOTIFICATION_BATCH_SIZE = 200  # outbox events per worker batch
+NOTIFICATION_CHANNELS = [
+    'library.notifications.EmailChannel',
+]
+NOTIFICATION_RETRY_DELAY = 60  # seconds before a failed delivery is retried, doubled per attempt
+NOTIFICATION_DELIVERY_TIMEOUT = 300  # seconds a worker may hold events it is delivering
+NOTIFICATION_UNREAD_TTL = 30  # seconds a cached unread count may lag behind without a shared cache
+NOTIFICATION_POLL_INTERVAL = 1.0  # seconds between cache checks of an open notification stream
+NOTIFICATION_LONG_POLL_TIMEOUT = 25  # seconds a long-poll request waits for a change
+NOTIFICATION_STREAM_MAX_AGE = 300  # seconds before an event stream is closed for reconnection
+DUE_REMINDER_DAYS = 2  # remind students this many days before a book is due
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=1025, cast=int)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='library@localhost')
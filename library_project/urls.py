@@ -5,9 +5,11 @@ from django.conf.urls.static import static
 from django.shortcuts import redirect
 from django.http import HttpResponseRedirect
 
+from library.identity import principal_id
+
 def redirect_admin(request):
     """Redirect Django admin to custom admin dashboard if logged in as admin"""
-    if request.session.get('is_admin'):
+    if principal_id(request.session, 'admin'):
         return HttpResponseRedirect('/admin/dashboard/')
     # If not logged in, redirect to custom admin login
     return HttpResponseRedirect('/login/admin/')